@@ -1,5 +1,7 @@
 import os
 
+import pytest
+
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 root_dir_content = os.listdir(BASE_DIR)
 PROJECT_DIR_NAME = 'yatube'
@@ -28,11 +30,18 @@ from django.utils.version import get_version
 assert get_version() < '3.0.0', 'Пожалуйста, используйте версию Django < 3.0.0'
 
 from yatube.settings import INSTALLED_APPS
+from core.testing import apply_test_settings
 
 assert any(app in INSTALLED_APPS for app in ['posts.apps.PostsConfig', 'posts']), (
     'Пожалуйста зарегистрируйте приложение в `settings.INSTALLED_APPS`'
 )
 
+
+@pytest.fixture(autouse=True)
+def test_settings(settings):
+    apply_test_settings(settings)
+
+
 pytest_plugins = [
     'tests.fixtures.fixture_user',
     'tests.fixtures.fixture_data',
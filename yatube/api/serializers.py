@@ -0,0 +1,76 @@
+"""Сериализация без моделей: строки `values()` прямо в словари ответа.
+
+Каждое публичное поле ответа связано с путём ORM. `?fields=` выбирает
+подмножество полей, и в SELECT попадают только их столбцы, а JOIN
+с авторами и группами - только если эти поля запрошены.
+"""
+from django.core.files.storage import default_storage
+
+from posts.timeline import TimelinePaginator
+from posts.utils import CursorPaginator
+
+POST_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'group': 'group__slug',
+    'image': 'image',
+    'thumbnail': 'thumbnail',
+    'comments_count': 'comments_count',
+}
+COMMENT_FIELDS = {
+    'id': 'id',
+    'text': 'text',
+    'pub_date': 'pub_date',
+    'author': 'author__username',
+    'post': 'post_id',
+}
+# Поля с именами файлов, которые отдаются ссылками.
+MEDIA_FIELDS = ('image', 'thumbnail')
+# Нужны пагинатору курсоров, даже если клиент их не просил.
+KEY_FIELDS = ('id', 'pub_date')
+
+
+class FieldsError(ValueError):
+    pass
+
+
+def parse_fields(value, available):
+    """Список полей из `?fields=a,b`; пустое значение - все поля."""
+    if not value:
+        return list(available)
+    fields = [field for field in value.split(',') if field]
+    unknown = [field for field in fields if field not in available]
+    if unknown:
+        raise FieldsError(
+            f'неизвестные поля: {", ".join(unknown)}; '
+            f'доступны: {", ".join(available)}')
+    return fields
+
+
+def select(queryset, fields, available):
+    """`values()` только со столбцами запрошенных полей и ключа."""
+    paths = {available[field] for field in (*fields, *KEY_FIELDS)}
+    return queryset.values(*paths)
+
+
+def serialize(row, fields, available):
+    data = {field: row[available[field]] for field in fields}
+    for field in MEDIA_FIELDS:
+        if data.get(field):
+            data[field] = default_storage.url(data[field])
+    return data
+
+
+class ValuesCursorPaginator(CursorPaginator):
+    """Пагинатор курсоров для словарей из `values()`."""
+
+    def key_for(self, row):
+        return row[self.date_field].isoformat(), row['id']
+
+
+class ValuesTimelinePaginator(TimelinePaginator):
+    """Лента подписок из словарей `values()`."""
+
+    key_for = ValuesCursorPaginator.key_for
@@ -0,0 +1,77 @@
+from django.conf import settings
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from posts.models import Comment, Follow, Group, Post, User
+
+
+class ApiTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='reader')
+        cls.author = User.objects.create_user(username='writer')
+        cls.group = Group.objects.create(title='Группа', slug='api-group')
+        Post.objects.bulk_create(
+            Post(author=cls.author, group=cls.group, text=f'Пост {i}')
+            for i in range(settings.API_PAGE_SIZE + 5)
+        )
+        cls.post = Post.objects.create(
+            author=cls.author, group=cls.group, text='Последний пост')
+        Comment.objects.create(post=cls.post, author=cls.user, text='Ответ')
+
+    def test_feed_pages(self):
+        """- Проверка ленты API и перехода по курсорам"""
+        response = self.client.get(reverse('api:index'))
+        data = response.json()
+        self.assertEqual(len(data['results']), settings.API_PAGE_SIZE)
+        self.assertEqual(data['results'][0], {
+            'id': self.post.pk,
+            'text': self.post.text,
+            'pub_date': data['results'][0]['pub_date'],
+            'author': 'writer',
+            'group': 'api-group',
+            'image': '',
+            'thumbnail': '',
+            'comments_count': 1,
+        })
+        self.assertIsNone(data['previous'])
+        second = self.client.get(data['next']).json()
+        self.assertEqual(len(second['results']), 6)
+        self.assertIsNone(second['next'])
+        self.assertEqual(self.client.get(second['previous']).json(), data)
+
+    def test_sparse_fields(self):
+        """- Проверка ?fields=: в SELECT только нужные столбцы"""
+        url = reverse('api:group_posts', kwargs={'slug': 'api-group'})
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(url, {'fields': 'id,text'}).json()
+        self.assertEqual(set(data['results'][0]), {'id', 'text'})
+        self.assertIn('fields=id%2Ctext', data['next'])
+        sql = queries[-1]['sql']
+        self.assertNotIn('auth_user', sql)
+        self.assertNotIn('comments_count', sql)
+        response = self.client.get(url, {'fields': 'id,password'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_post_and_comments(self):
+        """- Проверка поста и комментариев в API"""
+        url = reverse('api:post_detail', kwargs={'post_id': self.post.pk})
+        self.assertEqual(
+            self.client.get(url, {'fields': 'author'}).json(),
+            {'author': 'writer'})
+        url = reverse('api:comments', kwargs={'post_id': self.post.pk})
+        self.assertEqual(
+            self.client.get(url).json()['results'][0]['text'], 'Ответ')
+        for name in ('api:post_detail', 'api:comments'):
+            response = self.client.get(reverse(name, kwargs={'post_id': 0}))
+            self.assertEqual(response.status_code, 404)
+
+    def test_follow_feed(self):
+        """- Проверка ленты подписок в API"""
+        url = reverse('api:follow_index')
+        self.assertEqual(self.client.get(url).status_code, 401)
+        Follow.objects.create(user=self.user, author=self.author)
+        self.client.force_login(self.user)
+        data = self.client.get(url, {'fields': 'id'}).json()
+        self.assertEqual(data['results'][0], {'id': self.post.pk})
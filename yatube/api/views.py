@@ -0,0 +1,121 @@
+from django.conf import settings
+from django.http import JsonResponse
+from core.db import replica_reads
+from core.metrics import query_budget
+from posts.cache import conditional_page
+from posts.lookups import author_cache, group_cache, post_cache
+from posts.models import Comment, Post
+
+from .serializers import (COMMENT_FIELDS, POST_FIELDS, FieldsError,
+                          ValuesCursorPaginator, ValuesTimelinePaginator,
+                          parse_fields, select, serialize)
+
+
+def json_response(data, status=200):
+    # Кириллица без \u-экранирования заметно короче.
+    return JsonResponse(
+        data, status=status, json_dumps_params={'ensure_ascii': False})
+
+
+def error(message, status):
+    return json_response({'error': message}, status=status)
+
+
+def page_link(request, **cursor):
+    params = request.GET.copy()
+    for name in ('after', 'before', 'page'):
+        params.pop(name, None)
+    params.update(cursor)
+    query = params.urlencode()
+    return f'{request.path}?{query}' if query else request.path
+
+
+def paginated(request, queryset, available=POST_FIELDS,
+              paginator_class=ValuesCursorPaginator, **options):
+    """Страница ленты в JSON: поля `?fields=`, курсоры `after`/`before`."""
+    try:
+        fields = parse_fields(request.GET.get('fields'), available)
+    except FieldsError as exc:
+        return error(str(exc), 400)
+    paginator = paginator_class(
+        select(queryset, fields, available), settings.API_PAGE_SIZE,
+        **options)
+    page = paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page=request.GET.get('page'),
+    )
+    previous = None
+    if page.previous_cursor:
+        previous = page_link(request, before=page.previous_cursor)
+    elif page.number > 1:
+        previous = page_link(request)
+    return json_response({
+        'results': [serialize(row, fields, available) for row in page],
+        'next': page_link(request, after=page.next_cursor)
+        if page.next_cursor else None,
+        'previous': previous,
+    })
+
+
+@query_budget(1)
+@replica_reads
+@conditional_page
+def index(request):
+    return paginated(request, Post.objects.all())
+
+
+@query_budget(2)
+@replica_reads
+@conditional_page
+def group_posts(request, slug):
+    group = group_cache.get(slug)
+    if group is None:
+        return error('группа не найдена', 404)
+    return paginated(request, Post.objects.filter(group_id=group.pk))
+
+
+@query_budget(2)
+@replica_reads
+@conditional_page
+def profile(request, username):
+    author = author_cache.get(username)
+    if author is None:
+        return error('автор не найден', 404)
+    return paginated(request, Post.objects.filter(author_id=author.pk))
+
+
+@query_budget(4)
+@replica_reads
+@conditional_page
+def follow_index(request):
+    if not request.user.is_authenticated:
+        return error('нужна авторизация', 401)
+    return paginated(request, Post.objects.all(),
+                     paginator_class=ValuesTimelinePaginator,
+                     user=request.user)
+
+
+@query_budget(1)
+@replica_reads
+@conditional_page
+def post_detail(request, post_id):
+    try:
+        fields = parse_fields(request.GET.get('fields'), POST_FIELDS)
+    except FieldsError as exc:
+        return error(str(exc), 400)
+    row = select(Post.objects.filter(pk=post_id), fields, POST_FIELDS).first()
+    if row is None:
+        return error('пост не найден', 404)
+    return json_response(serialize(row, fields, POST_FIELDS))
+
+
+@query_budget(2)
+@replica_reads
+@conditional_page
+def comments(request, post_id):
+    if post_cache.get(post_id) is None:
+        return error('пост не найден', 404)
+    return paginated(
+        request, Comment.objects.filter(post_id=post_id),
+        COMMENT_FIELDS, descending=False)
@@ -0,0 +1,251 @@
+"""Бэкенды кэша со статистикой попаданий и общий кэш на SQLite.
+
+`SQLiteCache` хранит записи в файле базы SQLite в режиме WAL, поэтому
+один и тот же кэш видят все процессы gunicorn на машине, а внешние
+сервисы (memcached, Redis) не нужны.
+"""
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends import filebased, locmem
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+from .metrics import record_cache
+
+_MISSING = object()
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _record(alias, hits=0, misses=0):
+    with _stats_lock:
+        _stats[(alias, 'hits')] += hits
+        _stats[(alias, 'misses')] += misses
+    record_cache(hits, misses)
+
+
+class CacheStatsMixin:
+    """Считает попадания и промахи `get()` в пределах процесса.
+
+    Счётчики общие для всех потоков и ключуются `KEY_PREFIX` алиаса.
+    """
+
+    def get(self, key, default=None, version=None):
+        value = super().get(key, _MISSING, version)
+        if value is _MISSING:
+            _record(self.key_prefix, misses=1)
+            return default
+        _record(self.key_prefix, hits=1)
+        return value
+
+    def stats(self):
+        with _stats_lock:
+            hits = _stats[(self.key_prefix, 'hits')]
+            misses = _stats[(self.key_prefix, 'misses')]
+        total = hits + misses
+        return {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': hits / total if total else 0.0,
+        }
+
+    def reset_stats(self):
+        with _stats_lock:
+            _stats.pop((self.key_prefix, 'hits'), None)
+            _stats.pop((self.key_prefix, 'misses'), None)
+
+
+class LocMemCache(CacheStatsMixin, locmem.LocMemCache):
+    pass
+
+
+class FileBasedCache(CacheStatsMixin, filebased.FileBasedCache):
+    pass
+
+
+class SQLiteCache(CacheStatsMixin, BaseCache):
+    """Кэш в файле SQLite, общий для всех процессов машины."""
+
+    pickle_protocol = pickle.HIGHEST_PROTOCOL
+    cull_every = 100
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = location
+        self._local = threading.local()
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        # После fork соединение родителя использовать нельзя.
+        if connection is None or self._local.pid != os.getpid():
+            directory = os.path.dirname(self._path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(
+                self._path, timeout=5, isolation_level=None,
+                check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=NORMAL')
+            connection.execute(
+                'CREATE TABLE IF NOT EXISTS cache ('
+                'key TEXT PRIMARY KEY, value BLOB NOT NULL, expires REAL)')
+            connection.execute(
+                'CREATE INDEX IF NOT EXISTS cache_expires ON cache (expires)')
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+            self._local.writes = 0
+        return connection
+
+    def _key(self, key, version):
+        key = self.make_key(key, version=version)
+        self.validate_key(key)
+        return key
+
+    def _alive(self, expires):
+        return expires is None or expires > time.time()
+
+    def _write(self, sql, params):
+        connection = self._connection()
+        cursor = connection.execute(sql, params)
+        self._local.writes += 1
+        if self._local.writes % self.cull_every == 0:
+            self._cull(connection)
+        return cursor
+
+    def _cull(self, connection):
+        connection.execute(
+            'DELETE FROM cache WHERE expires <= ?', (time.time(),))
+        count, = connection.execute('SELECT COUNT(*) FROM cache').fetchone()
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            connection.execute('DELETE FROM cache')
+            return
+        # NULL в SQLite меньше любого числа: без `expires IS NULL`
+        # первыми ушли бы бессрочные версии и счётчики.
+        connection.execute(
+            'DELETE FROM cache WHERE key IN ('
+            'SELECT key FROM cache ORDER BY expires IS NULL, expires '
+            'LIMIT ?)',
+            (count // self._cull_frequency,))
+
+    def _load(self, row):
+        if row is None or not self._alive(row[1]):
+            return _MISSING
+        return pickle.loads(row[0])
+
+    def get(self, key, default=None, version=None):
+        key = self._key(key, version)
+        row = self._connection().execute(
+            'SELECT value, expires FROM cache WHERE key = ?', (key,)
+        ).fetchone()
+        value = self._load(row)
+        if value is _MISSING:
+            _record(self.key_prefix, misses=1)
+            return default
+        _record(self.key_prefix, hits=1)
+        return value
+
+    def get_many(self, keys, version=None):
+        keys = {self._key(key, version): key for key in keys}
+        if not keys:
+            return {}
+        placeholders = ', '.join('?' * len(keys))
+        rows = self._connection().execute(
+            f'SELECT key, value, expires FROM cache '
+            f'WHERE key IN ({placeholders})', list(keys)
+        ).fetchall()
+        found = {}
+        for key, value, expires in rows:
+            value = self._load((value, expires))
+            if value is not _MISSING:
+                found[keys[key]] = value
+        _record(self.key_prefix, hits=len(found),
+                misses=len(keys) - len(found))
+        return found
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        self._write(
+            'INSERT OR REPLACE INTO cache (key, value, expires) '
+            'VALUES (?, ?, ?)',
+            (self._key(key, version),
+             pickle.dumps(value, self.pickle_protocol),
+             self.get_backend_timeout(timeout)),
+        )
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._write(
+            'INSERT INTO cache (key, value, expires) VALUES (?, ?, ?) '
+            'ON CONFLICT (key) DO UPDATE SET '
+            'value = excluded.value, expires = excluded.expires '
+            'WHERE cache.expires <= ?',
+            (self._key(key, version),
+             pickle.dumps(value, self.pickle_protocol),
+             self.get_backend_timeout(timeout), time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        cursor = self._write(
+            'UPDATE cache SET expires = ? WHERE key = ? '
+            'AND (expires IS NULL OR expires > ?)',
+            (self.get_backend_timeout(timeout), self._key(key, version),
+             time.time()),
+        )
+        return cursor.rowcount > 0
+
+    def delete(self, key, version=None):
+        self._connection().execute(
+            'DELETE FROM cache WHERE key = ?', (self._key(key, version),))
+
+    def has_key(self, key, version=None):
+        row = self._connection().execute(
+            'SELECT expires FROM cache WHERE key = ?',
+            (self._key(key, version),)
+        ).fetchone()
+        return row is not None and self._alive(row[0])
+
+    def incr(self, key, delta=1, version=None):
+        key = self._key(key, version)
+        connection = self._connection()
+        # BEGIN IMMEDIATE сразу берёт блокировку записи: инкремент атомарен
+        # между процессами.
+        connection.execute('BEGIN IMMEDIATE')
+        try:
+            row = connection.execute(
+                'SELECT value, expires FROM cache WHERE key = ?', (key,)
+            ).fetchone()
+            value = self._load(row)
+            if value is _MISSING:
+                raise ValueError(f"Key '{key}' not found")
+            value += delta
+            connection.execute(
+                'UPDATE cache SET value = ? WHERE key = ?',
+                (pickle.dumps(value, self.pickle_protocol), key))
+        except Exception:
+            connection.execute('ROLLBACK')
+            raise
+        connection.execute('COMMIT')
+        return value
+
+    def clear(self):
+        self._connection().execute('DELETE FROM cache')
+
+    def close(self, **kwargs):
+        # Соединение живёт весь срок потока, как и у сессий SQLite Django.
+        pass
+
+
+def cache_stats():
+    """Статистика попаданий по всем настроенным алиасам кэша."""
+    return {
+        alias: caches[alias].stats()
+        for alias in settings.CACHES
+        if hasattr(caches[alias], 'stats')
+    }
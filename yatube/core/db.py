@@ -0,0 +1,111 @@
+"""Маршрутизация чтения на реплики базы.
+
+Вьюхи, помеченные `@replica_reads`, читают из случайной реплики
+из `DATABASE_REPLICAS`; все записи и остальные вьюхи работают
+с `default`. После запроса, меняющего данные, клиент на
+`REPLICA_PIN_SECONDS` прикрепляется к основной базе, чтобы видеть
+свои же изменения, пока реплики их не догнали.
+
+Реплики копирует `sync_replicas` каждые `REPLICA_SYNC_INTERVAL` секунд
+и запоминает время начала копирования. Реплика, не обновлявшаяся
+дольше `REPLICA_PIN_SECONDS` (два интервала), не используется: так
+отставание ограничено, и прикрепления на это время хватает, чтобы
+клиент увидел свою запись.
+
+Пока реплики не скопированы после последней записи, прочитанное из них
+не кладётся в общие кэши: запись уже сбросила их, и данные из
+отстающей реплики легли бы в кэш под новой версией.
+
+Пользователи, сессии и типы содержимого всегда читаются из основной
+базы: без них только что зарегистрированный пользователь не войдёт.
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import caches
+
+PRIMARY = 'default'
+LAST_WRITE_KEY = 'db:last_write'
+REPLICAS_SYNCED_KEY = 'db:replicas_synced'
+PRIMARY_APPS = {'auth', 'sessions', 'contenttypes'}
+
+_local = threading.local()
+
+
+def replica_reads(view_func):
+    """Разрешает вьюхе читать из реплик."""
+    view_func.replica_reads = True
+    return view_func
+
+
+def read_alias():
+    """Алиас базы для чтения в текущем потоке; None - основная."""
+    return getattr(_local, 'read_alias', None)
+
+
+def route_reads(alias):
+    """Направляет чтение до конца запроса в `alias`."""
+    _local.read_alias = alias
+
+
+@contextmanager
+def reading_from(alias):
+    previous = read_alias()
+    _local.read_alias = alias
+    try:
+        yield
+    finally:
+        _local.read_alias = previous
+
+
+def note_write():
+    """Запоминает время записи для `may_cache_reads()`."""
+    caches['counters'].set(LAST_WRITE_KEY, time.time(), None)
+
+
+def note_sync(started):
+    """Запоминает время начала копирования основной базы в реплики."""
+    caches['counters'].set(REPLICAS_SYNCED_KEY, started, None)
+
+
+def may_cache_reads():
+    """Можно ли класть прочитанное в текущем потоке в общие кэши."""
+    if read_alias() is None:
+        return True
+    values = caches['counters'].get_many([LAST_WRITE_KEY, REPLICAS_SYNCED_KEY])
+    last_write = values.get(LAST_WRITE_KEY)
+    synced = values.get(REPLICAS_SYNCED_KEY)
+    # В копию попадает всё, что закоммичено до начала копирования.
+    return last_write is None or (synced is not None and synced > last_write)
+
+
+def choose_replica():
+    """Случайная реплика; None, если реплик нет или они устарели."""
+    replicas = settings.DATABASE_REPLICAS
+    if not replicas:
+        return None
+    synced = caches['counters'].get(REPLICAS_SYNCED_KEY)
+    if synced is None or time.time() - synced > settings.REPLICA_PIN_SECONDS:
+        return None
+    return random.choice(replicas)
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if model._meta.app_label in PRIMARY_APPS:
+            return PRIMARY
+        return read_alias() or PRIMARY
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики - копии основной базы, связи между ними допустимы.
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Схема попадает в реплики вместе с данными при синхронизации.
+        return db == PRIMARY
@@ -0,0 +1,57 @@
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.utils import timezone
+
+from core.sqlite import backup
+
+
+class Command(BaseCommand):
+    help = ('Онлайн-бэкап базы SQLite через backup API небольшими шагами, '
+            'не останавливая запись')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'target',
+            help='Файл копии или каталог для копии с датой в имени')
+        parser.add_argument('--database', default='default')
+        parser.add_argument(
+            '--pages', type=int, default=256,
+            help='Страниц за шаг; -1 - вся база за один шаг')
+        parser.add_argument(
+            '--sleep', type=float, default=0.05,
+            help='Пауза между шагами, секунды')
+        parser.add_argument(
+            '--keep', type=int, default=0,
+            help='Сколько последних копий оставить в каталоге; 0 - все')
+
+    def handle(self, *args, **options):
+        settings_dict = connections[options['database']].settings_dict
+        if settings_dict['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Онлайн-бэкап есть только для SQLite')
+        target = options['target']
+        directory = None
+        if os.path.isdir(target):
+            directory = target
+            stamp = timezone.now().strftime('%Y%m%d-%H%M%S')
+            target = os.path.join(directory, f'db-{stamp}.sqlite3')
+
+        def progress(status, remaining, total):
+            self.stdout.write(
+                f'\rСкопировано страниц: {total - remaining} из {total}',
+                ending='')
+
+        backup(settings_dict['NAME'], target, pages=options['pages'],
+               sleep=options['sleep'], progress=progress)
+        self.stdout.write('')
+        if directory and options['keep']:
+            self.rotate(directory, options['keep'])
+        self.stdout.write(self.style.SUCCESS(f'Копия сохранена: {target}'))
+
+    def rotate(self, directory, keep):
+        backups = sorted(
+            name for name in os.listdir(directory)
+            if name.startswith('db-') and name.endswith('.sqlite3'))
+        for name in backups[:-keep]:
+            os.remove(os.path.join(directory, name))
@@ -0,0 +1,41 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.db import note_sync
+from core.sqlite import backup
+
+
+class Command(BaseCommand):
+    help = ('Копирует основную базу SQLite в файлы реплик '
+            '(YATUBE_DB_REPLICAS) через backup API')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval', type=float, default=settings.REPLICA_SYNC_INTERVAL,
+            help='Повторять каждые N секунд (по умолчанию '
+                 'REPLICA_SYNC_INTERVAL); 0 - скопировать один раз')
+
+    def handle(self, *args, **options):
+        primary = connections['default'].settings_dict
+        if primary['ENGINE'] != 'django.db.backends.sqlite3':
+            raise CommandError('Копирование реплик есть только для SQLite')
+        if not settings.DATABASE_REPLICA_FILES:
+            raise CommandError('Реплики не настроены: YATUBE_DB_REPLICAS')
+        while True:
+            started = time.time()
+            for path in settings.DATABASE_REPLICA_FILES.values():
+                backup(primary['NAME'], path, sleep=0)
+            # В копиях всё, что закоммичено до начала копирования.
+            note_sync(started)
+            elapsed = time.time() - started
+            self.stdout.write(f'Реплики обновлены за {elapsed:.2f} с')
+            if elapsed > settings.REPLICA_SYNC_INTERVAL:
+                self.stderr.write(
+                    'Копирование дольше REPLICA_SYNC_INTERVAL: реплики '
+                    'будут отставать больше REPLICA_PIN_SECONDS')
+            if not options['interval']:
+                return
+            time.sleep(max(options['interval'] - elapsed, 0))
@@ -0,0 +1,196 @@
+"""Метрики запроса: SQL, рендеринг шаблонов, кэш и бюджеты запросов.
+
+Метрики текущего запроса собирает `RequestMetricsMiddleware`, а шаблоны
+и кэш дописывают в них свои числа через `current()`. Последние
+`REQUEST_STATS_WINDOW` запросов каждой вьюхи хранятся в памяти процесса
+для страницы статистики.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+_history = defaultdict(deque)
+_history_lock = threading.Lock()
+
+
+class QueryBudgetExceeded(AssertionError):
+    """Вьюха сделала больше запросов к базе, чем ей разрешено."""
+
+
+def query_budget(limit):
+    """Объявляет, сколько запросов к базе может сделать вьюха."""
+    def decorator(view_func):
+        view_func.query_budget = limit
+        return view_func
+    return decorator
+
+
+class RequestMetrics:
+    """Счётчики одного запроса; экземпляр - обёртка `execute_wrapper`."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.duration = 0.0
+        self.queries = []
+        self.sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self.view_name = None
+        self.view_queries_start = 0
+        self.budget = None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries.append((sql, repr(params)))
+
+    @property
+    def query_count(self):
+        return len(self.queries)
+
+    @property
+    def duplicates(self):
+        """Запросы, повторённые с теми же параметрами."""
+        return len(self.queries) - len(set(self.queries))
+
+    @property
+    def similar(self):
+        """Запросы с тем же SQL, но другими параметрами: признак N+1."""
+        return (len(set(self.queries))
+                - len({sql for sql, _ in self.queries}))
+
+    @property
+    def view_queries(self):
+        return len(self.queries) - self.view_queries_start
+
+    def start_view(self, view_name, budget):
+        self.view_name = view_name
+        self.budget = budget
+        self.view_queries_start = len(self.queries)
+
+    def finish(self):
+        self.duration = time.perf_counter() - self.started
+
+    def server_timing(self):
+        return ', '.join((
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.query_count} '
+            f'queries, {self.duplicates} duplicate, {self.similar} similar"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'cache;desc="{self.cache_hits} hits, '
+            f'{self.cache_misses} misses"',
+            f'total;dur={self.duration * 1000:.1f}',
+        ))
+
+    def over_budget(self):
+        return self.budget is not None and self.view_queries > self.budget
+
+    def check_budget(self):
+        if not self.over_budget():
+            return
+        message = (f'{self.view_name}: {self.view_queries} запросов к базе '
+                   f'при бюджете {self.budget}')
+        logger.warning(message)
+        if settings.QUERY_BUDGET_RAISE:
+            raise QueryBudgetExceeded(message)
+
+
+def current():
+    """Метрики запроса, который обрабатывает текущий поток, или None."""
+    return getattr(_local, 'metrics', None)
+
+
+@contextmanager
+def activate(metrics):
+    previous = current()
+    _local.metrics = metrics
+    try:
+        yield metrics
+    finally:
+        _local.metrics = previous
+
+
+def record_cache(hits=0, misses=0):
+    metrics = current()
+    if metrics is not None:
+        metrics.cache_hits += hits
+        metrics.cache_misses += misses
+
+
+@contextmanager
+def template_timer():
+    # Вложенные рендеры уже входят во время внешнего.
+    metrics = current()
+    if metrics is None:
+        yield
+        return
+    metrics.template_depth += 1
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        metrics.template_depth -= 1
+        if not metrics.template_depth:
+            metrics.template_time += time.perf_counter() - started
+
+
+def remember(metrics):
+    """Добавляет запрос в скользящее окно статистики его вьюхи."""
+    if metrics.view_name is None:
+        return
+    with _history_lock:
+        window = _history[metrics.view_name]
+        window.append((
+            metrics.duration, metrics.query_count, metrics.sql_time,
+            metrics.template_time, metrics.duplicates + metrics.similar,
+            metrics.cache_hits, metrics.cache_misses,
+            metrics.over_budget(),
+        ))
+        while len(window) > settings.REQUEST_STATS_WINDOW:
+            window.popleft()
+
+
+def _percentile(values, percent):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * percent / 100))]
+
+
+def rolling_stats():
+    """Сводка по последним запросам каждой вьюхи; время в миллисекундах."""
+    with _history_lock:
+        history = {name: list(window) for name, window in _history.items()}
+    stats = {}
+    for name, rows in sorted(history.items()):
+        (durations, queries, sql_times, template_times, repeated,
+         hits, misses, overruns) = zip(*rows)
+        count = len(rows)
+        stats[name] = {
+            'requests': count,
+            'p50_ms': round(_percentile(durations, 50) * 1000, 1),
+            'p95_ms': round(_percentile(durations, 95) * 1000, 1),
+            'avg_queries': round(sum(queries) / count, 1),
+            'max_queries': max(queries),
+            'avg_sql_ms': round(sum(sql_times) / count * 1000, 1),
+            'avg_template_ms': round(sum(template_times) / count * 1000, 1),
+            'repeated_queries': sum(repeated),
+            'cache_hits': sum(hits),
+            'cache_misses': sum(misses),
+            'over_budget': sum(overruns),
+        }
+    return stats
+
+
+def reset_stats():
+    with _history_lock:
+        _history.clear()
@@ -0,0 +1,67 @@
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from . import db, metrics
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS', 'TRACE')
+
+
+class RequestMetricsMiddleware:
+    """Собирает метрики запроса и отдаёт их в заголовке `Server-Timing`.
+
+    Стоит первым в `MIDDLEWARE`, чтобы учесть работу всех остальных.
+    Бюджет запросов вьюхи (`@query_budget`) проверяется после ответа.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request_metrics = metrics.RequestMetrics()
+        with metrics.activate(request_metrics), ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(
+                    connection.execute_wrapper(request_metrics))
+            response = self.get_response(request)
+        request_metrics.finish()
+        response['Server-Timing'] = request_metrics.server_timing()
+        metrics.remember(request_metrics)
+        request_metrics.check_budget()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request_metrics = metrics.current()
+        if request_metrics is not None:
+            request_metrics.start_view(
+                request.resolver_match.view_name,
+                getattr(view_func, 'query_budget', None),
+            )
+
+
+class ReplicaRoutingMiddleware:
+    """Отправляет чтение вьюх с `@replica_reads` в реплики.
+
+    Ответ на запрос, меняющий данные, ставит cookie: пока она жива,
+    клиент читает из основной базы и видит свои изменения.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with db.reading_from(None):
+            response = self.get_response(request)
+        if request.method not in SAFE_METHODS:
+            response.set_cookie(
+                settings.REPLICA_PIN_COOKIE, '1',
+                max_age=settings.REPLICA_PIN_SECONDS,
+                httponly=True, samesite='Lax')
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if (getattr(view_func, 'replica_reads', False)
+                and request.method in ('GET', 'HEAD')
+                and settings.REPLICA_PIN_COOKIE not in request.COOKIES):
+            db.route_reads(db.choose_replica())
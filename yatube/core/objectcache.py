@@ -0,0 +1,236 @@
+"""Двухуровневый кэш частых выборок объектов по ключу.
+
+Первый уровень - LRU с TTL в памяти процесса, второй - общий кэш
+`objects`, третий - загрузчик из базы. Объекты хранятся
+сериализованными, поэтому каждый вызов получает свою копию и правка
+объекта во вьюхе не портит кэш.
+
+Сброс - сменой версии в кэше `counters`: ключи общего кэша включают
+версию, а процессы сверяют её не реже раза в `check_interval` секунд
+и при смене очищают свой LRU. Процесс, вызвавший `invalidate()`,
+очищает LRU сразу.
+
+Один объект сбрасывает `invalidate_key()`: ключ удаляется из общего
+кэша и записывается в журнал в `counters` под очередным номером.
+Сверяя версию, процессы читают из журнала ключи, сброшенные с прошлой
+сверки, и убирают их из своего LRU; если пропущено больше `size`
+записей, LRU очищается целиком.
+
+Отсутствие объекта тоже кэшируется - пустой строкой байт на
+`negative_ttl`: выдуманные ключи от краулеров и битых ссылок не
+доходят до базы, а создание объекта сбрасывает версию и вместе с ней
+закэшированные промахи.
+"""
+import pickle
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import Http404
+
+from .db import may_cache_reads, note_write
+from .metrics import record_cache
+
+_registry = {}
+# Сериализованный объект не бывает пустым.
+MISSING = b''
+
+
+class CachedNotFound(Http404):
+    """Объекта нет, и это известно из кэша, без запроса к базе."""
+
+
+class ObjectCache:
+    def __init__(self, name, loader, size=None, ttl=None,
+                 check_interval=None, negative_ttl=None, alias='objects'):
+        self.name = name
+        self.loader = loader
+        self.size = size or settings.OBJECT_CACHE_SIZE
+        self.ttl = ttl or settings.OBJECT_CACHE_TTL
+        self.negative_ttl = (
+            negative_ttl or settings.OBJECT_CACHE_NEGATIVE_TTL)
+        self.check_interval = (
+            settings.OBJECT_CACHE_CHECK_INTERVAL
+            if check_interval is None else check_interval)
+        self.alias = alias
+        self._lock = threading.Lock()
+        self._local = OrderedDict()
+        self._version = None
+        self._position = None
+        # Растёт при каждом сбросе ключа в этом процессе: загруженное
+        # до сброса не должно попасть в LRU после него.
+        self._epoch = 0
+        self._checked = 0
+        self._stats = Counter()
+        _registry[name] = self
+
+    @property
+    def _version_key(self):
+        return f'objects:version:{self.name}'
+
+    @property
+    def _log_key(self):
+        return f'objects:log:{self.name}'
+
+    def version(self):
+        """Версия кэша; при её смене в другом процессе LRU очищается."""
+        now = time.monotonic()
+        if (self._version is not None
+                and now - self._checked < self.check_interval):
+            return self._version
+        counters = caches['counters']
+        state = counters.get_many([self._version_key, self._log_key])
+        version = state.get(self._version_key)
+        if version is None:
+            counters.add(self._version_key, time.time_ns(), None)
+            version = counters.get(self._version_key)
+        position = state.get(self._log_key, 0)
+        stale = self._stale_keys(position)
+        with self._lock:
+            if version != self._version or stale is None:
+                self._local.clear()
+                self._version = version
+            for key in stale or ():
+                self._local.pop(key, None)
+            if stale != ():
+                self._epoch += 1
+            self._position = position
+            self._checked = now
+        return version
+
+    def _stale_keys(self, position):
+        """Ключи, сброшенные с прошлой сверки; None - сбросить все."""
+        last = self._position
+        if last is None or position == last:
+            return ()
+        if position < last or position - last > self.size:
+            return None
+        names = [f'{self._log_key}:{number}'
+                 for number in range(last + 1, position + 1)]
+        return list(caches['counters'].get_many(names).values())
+
+    def invalidate(self):
+        """Сбрасывает кэш во всех процессах."""
+        self._bump()
+        if transaction.get_connection().in_atomic_block:
+            # Соседний запрос мог успеть закэшировать строку до фиксации.
+            transaction.on_commit(self._bump)
+
+    def invalidate_key(self, key):
+        """Сбрасывает один объект (или закэшированный промах)."""
+        key = str(key)
+        self._forget(key)
+        if transaction.get_connection().in_atomic_block:
+            transaction.on_commit(lambda: self._forget(key))
+
+    def _forget(self, key):
+        note_write()
+        counters = caches['counters']
+        try:
+            position = counters.incr(self._log_key)
+        except ValueError:
+            counters.add(self._log_key, 0, None)
+            position = counters.incr(self._log_key)
+        # Дольше TTL записи журнала не нужны: LRU к тому времени истёк.
+        counters.set(f'{self._log_key}:{position}', key, self.ttl * 2)
+        caches[self.alias].delete(f'{self.name}:{self.version()}:{key}')
+        with self._lock:
+            self._local.pop(key, None)
+            self._epoch += 1
+
+    def _bump(self):
+        note_write()
+        counters = caches['counters']
+        try:
+            counters.incr(self._version_key)
+        except ValueError:
+            counters.set(self._version_key, time.time_ns(), None)
+        with self._lock:
+            self._local.clear()
+            self._version = None
+
+    def _local_get(self, key, version):
+        with self._lock:
+            entry = self._local.get(key)
+            # Версия в записи защищает от гонки с invalidate() в соседнем
+            # потоке: запись, загруженная до сброса, не будет прочитана.
+            if (entry is None or entry[0] <= time.monotonic()
+                    or entry[1] != version):
+                self._stats['misses'] += 1
+                return None
+            self._local.move_to_end(key)
+            self._stats['hits' if entry[2] else 'negative_hits'] += 1
+            return entry[2]
+
+    def _local_set(self, key, version, epoch, data):
+        ttl = self.ttl if data else self.negative_ttl
+        with self._lock:
+            if epoch != self._epoch:
+                return
+            self._local[key] = (time.monotonic() + ttl, version, data)
+            self._local.move_to_end(key)
+            while len(self._local) > self.size:
+                self._local.popitem(last=False)
+
+    def _get(self, key):
+        """Сериализованный объект или MISSING и признак попадания."""
+        version = self.version()
+        epoch = self._epoch
+        # Ключ из URL и ключ из сигнала (5 и '5') - один и тот же объект.
+        name = str(key)
+        data = self._local_get(name, version)
+        if data is not None:
+            record_cache(hits=1)
+            return data, True
+        shared = caches[self.alias]
+        shared_key = f'{self.name}:{version}:{name}'
+        data = shared.get(shared_key)
+        cached = data is not None
+        if not cached:
+            obj = self.loader(key)
+            data = (MISSING if obj is None
+                    else pickle.dumps(obj, pickle.HIGHEST_PROTOCOL))
+            if not may_cache_reads():
+                return data, cached
+            shared.set(shared_key, data,
+                       self.ttl if data else self.negative_ttl)
+        self._local_set(name, version, epoch, data)
+        return data, cached
+
+    def get(self, key):
+        """Объект по ключу; None, если загрузчик его не нашёл."""
+        data, _ = self._get(key)
+        return pickle.loads(data) if data else None
+
+    def get_or_404(self, key):
+        data, cached = self._get(key)
+        if not data:
+            error = CachedNotFound if cached else Http404
+            raise error(f'{self.name} {key} не найден')
+        return pickle.loads(data)
+
+    def stats(self):
+        """Попадания в LRU процесса; общий кэш считает их сам."""
+        with self._lock:
+            hits, misses = self._stats['hits'], self._stats['misses']
+            negative_hits = self._stats['negative_hits']
+            size = len(self._local)
+        total = hits + negative_hits + misses
+        return {
+            'hits': hits,
+            'negative_hits': negative_hits,
+            'misses': misses,
+            'hit_rate': (hits + negative_hits) / total if total else 0.0,
+            'size': size,
+        }
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats.clear()
+
+
+def object_cache_stats():
+    return {name: cache.stats() for name, cache in _registry.items()}
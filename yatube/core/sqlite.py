@@ -0,0 +1,87 @@
+"""Боевой режим SQLite: прагмы соединений, повтор при блокировке, бэкапы.
+
+В режиме WAL читатели не ждут писателя, а `busy_timeout` заставляет
+писателей ждать друг друга вместо мгновенной ошибки. Остаются случаи,
+когда SQLite отвечает `database is locked` сразу (чтение в транзакции,
+переходящее в запись), - их закрывает `retry_on_lock`.
+"""
+import logging
+import os
+import random
+import sqlite3
+import time
+from functools import wraps
+
+from django.conf import settings
+from django.db import OperationalError, transaction
+
+logger = logging.getLogger(__name__)
+
+
+def apply_pragmas(sender, connection, **kwargs):
+    """Обработчик `connection_created`: прагмы `SQLITE_PRAGMAS`.
+
+    Прагмы идут в соединение sqlite3 мимо курсора Django, поэтому
+    не попадают в счётчик запросов вьюхи.
+    """
+    if connection.vendor != 'sqlite' or not settings.SQLITE_PRAGMAS:
+        return
+    read_only = connection.alias in settings.DATABASE_REPLICAS
+    raw = connection.connection
+    for pragma, value in settings.SQLITE_PRAGMAS.items():
+        if pragma == 'journal_mode':
+            # Режим журнала хранится в файле: меняем его один раз,
+            # а реплику не меняем вовсе.
+            mode = raw.execute('PRAGMA journal_mode').fetchone()[0]
+            if read_only or mode.lower() == str(value).lower():
+                continue
+        raw.execute(f'PRAGMA {pragma} = {value}')
+
+
+def is_locked(error):
+    return 'database is locked' in str(error)
+
+
+def retry_on_lock(view_func):
+    """Выполняет вьюху в транзакции и повторяет её при блокировке базы.
+
+    Откат транзакции делает повтор безопасным. Внутри уже открытой
+    транзакции повторять нечего: ошибку обработает внешний код.
+    """
+    @wraps(view_func)
+    def wrapper(*args, **kwargs):
+        if transaction.get_connection().in_atomic_block:
+            return view_func(*args, **kwargs)
+        attempts = settings.SQLITE_LOCK_RETRIES
+        for attempt in range(1, attempts + 1):
+            try:
+                with transaction.atomic():
+                    return view_func(*args, **kwargs)
+            except OperationalError as error:
+                if not is_locked(error) or attempt == attempts:
+                    raise
+                delay = settings.SQLITE_LOCK_RETRY_DELAY * 2 ** (attempt - 1)
+                logger.warning('База заблокирована, повтор %s через %.3f с',
+                               attempt, delay)
+                time.sleep(delay * random.uniform(0.5, 1.5))
+    return wrapper
+
+
+def backup(source_path, target_path, pages=-1, sleep=0.25, progress=None):
+    """Онлайн-копия базы через backup API SQLite.
+
+    Копирует по `pages` страниц за шаг с паузой `sleep` между шагами,
+    чтобы не держать блокировку чтения долго. Копия собирается рядом
+    с целью и подменяет её атомарно.
+    """
+    temporary = f'{target_path}.tmp'
+    source = sqlite3.connect(source_path)
+    target = sqlite3.connect(temporary)
+    try:
+        source.backup(target, pages=pages, progress=progress, sleep=sleep)
+        # Копия открывается отдельно от основной базы: WAL ей не нужен.
+        target.execute('PRAGMA journal_mode=DELETE')
+    finally:
+        target.close()
+        source.close()
+    os.replace(temporary, target_path)
@@ -0,0 +1,23 @@
+from django.template import TemplateDoesNotExist
+from django.template.backends import django
+
+from .metrics import template_timer
+
+
+class Template(django.Template):
+    def render(self, context=None, request=None):
+        with template_timer():
+            return super().render(context, request)
+
+
+class DjangoTemplates(django.DjangoTemplates):
+    """Шаблонизатор Django, замеряющий время рендеринга для метрик."""
+
+    def from_string(self, template_code):
+        return Template(self.engine.from_string(template_code), self)
+
+    def get_template(self, template_name):
+        try:
+            return Template(self.engine.get_template(template_name), self)
+        except TemplateDoesNotExist as exc:
+            django.reraise(exc, self)
@@ -1,10 +1,33 @@
 from django import template
+from django.http import QueryDict
 # В template.Library зарегистрированы все встроенные теги и фильтры шаблонов;
 # добавляем к ним и наш фильтр.
 register = template.Library()
 
+# GET-параметры, которые переносятся в ссылки пагинатора. Ссылки лежат
+# и в общих фрагментах, ключи которых других параметров не учитывают.
+CURSOR_QUERY_KEEPS = ('q',)
+
 
 @register.filter
 # это применение "декоратора", функций, меняющих поведение функций
 def addclass(field, css):
     return field.as_widget(attrs={'class': css})
+
+
+@register.simple_tag(takes_context=True)
+def cursor_query(context, **kwargs):
+    """Строка запроса текущей страницы с заменёнными параметрами пагинации.
+
+    Из остальных GET-параметров сохраняются только `CURSOR_QUERY_KEEPS`
+    (поисковый запрос `q`).
+    """
+    params = context['request'].GET
+    query = QueryDict(mutable=True)
+    for key in CURSOR_QUERY_KEEPS:
+        if key in params:
+            query.setlist(key, params.getlist(key))
+    for key, value in kwargs.items():
+        if value:
+            query[key] = value
+    return query.urlencode()
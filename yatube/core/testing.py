@@ -0,0 +1,25 @@
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+
+# Настройки проекта под тестами: их ставят и `manage.py test`, и py.test
+# (tests/conftest.py).
+TEST_SETTINGS = {
+    # Картинки режутся сразу: файлы из пула не должны появляться
+    # во временной папке медиа, когда тест её уже удаляет.
+    'THUMBNAIL_WORKERS': 0,
+    # Превышение бюджета запросов вьюхи - ошибка теста.
+    'QUERY_BUDGET_RAISE': True,
+}
+
+
+def apply_test_settings(target=settings):
+    for name, value in TEST_SETTINGS.items():
+        setattr(target, name, value)
+
+
+class TestRunner(DiscoverRunner):
+    """Запуск тестов `manage.py test` с тестовыми настройками проекта."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        apply_test_settings()
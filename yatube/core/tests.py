@@ -1,6 +1,26 @@
-from django.test import TestCase, Client, override_settings
+import os
+import sqlite3
+import tempfile
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import OperationalError, connection
+from django.test import (RequestFactory, TestCase, TransactionTestCase,
+                         Client, override_settings)
+from django.urls import reverse
 from http import HTTPStatus
-from posts.models import User
+from posts import views
+from posts.lookups import author_cache
+from posts.models import Post, User
+
+from . import db
+from .cache import SQLiteCache
+from .middleware import ReplicaRoutingMiddleware
+from .sqlite import apply_pragmas, backup, retry_on_lock
+from .metrics import QueryBudgetExceeded, reset_stats
+from .objectcache import CachedNotFound, ObjectCache
 
 
 # class ViewTestClass(TestCase):
@@ -22,3 +42,298 @@ class Custom404Template(TestCase):
         response = authorized_client.post('/create/')
         self.assertTemplateUsed(response, 'core/403csrf.html')
         # CSRF_FORM_URL = '/create/'
+
+
+class SQLiteCacheTest(TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.cache = SQLiteCache(
+            os.path.join(self.directory.name, 'cache.sqlite3'),
+            {'KEY_PREFIX': 'test-sqlite'})
+        self.cache.reset_stats()
+
+    def test_set_get_add_delete(self):
+        """- Проверка базовых операций кэша на SQLite"""
+        self.cache.set('key', {'value': 1})
+        self.assertEqual(self.cache.get('key'), {'value': 1})
+        self.assertFalse(self.cache.add('key', 'other'))
+        self.assertTrue(self.cache.add('new', 'value'))
+        self.assertEqual(
+            self.cache.get_many(['key', 'new', 'missing']),
+            {'key': {'value': 1}, 'new': 'value'})
+        self.cache.delete('key')
+        self.assertIsNone(self.cache.get('key'))
+
+    def test_expired_entry_is_missing(self):
+        """- Проверка истечения записей кэша на SQLite"""
+        self.cache.set('key', 'value', timeout=-1)
+        self.assertFalse(self.cache.has_key('key'))
+        self.assertTrue(self.cache.add('key', 'fresh'))
+        self.assertEqual(self.cache.get('key'), 'fresh')
+
+    def test_incr_and_stats(self):
+        """- Проверка инкремента и статистики попаданий"""
+        with self.assertRaises(ValueError):
+            self.cache.incr('counter')
+        self.cache.set('counter', 1, None)
+        self.assertEqual(self.cache.incr('counter', 2), 3)
+        self.cache.get('counter')
+        self.cache.get('missing')
+        stats = self.cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+        self.assertEqual(stats['hit_rate'], 0.5)
+
+    def test_cull_keeps_entries_without_timeout(self):
+        """- Проверка, что при чистке бессрочные записи уходят последними"""
+        cache = SQLiteCache(
+            os.path.join(self.directory.name, 'cull.sqlite3'),
+            {'KEY_PREFIX': 'test-cull', 'OPTIONS': {'MAX_ENTRIES': 10}})
+        cache.cull_every = 1
+        cache.set('generation', 1, None)
+        for i in range(20):
+            cache.set(f'page{i}', i, 300)
+        self.assertEqual(cache.get('generation'), 1)
+
+
+class RequestMetricsTest(TestCase):
+    def setUp(self):
+        reset_stats()
+        caches['pages'].clear()
+
+    def test_server_timing_header(self):
+        """- Проверка заголовка Server-Timing"""
+        response = self.client.get(reverse('posts:index'))
+        timing = response['Server-Timing']
+        for metric in ('db;dur=', 'tpl;dur=', 'cache;desc=', 'total;dur='):
+            self.assertIn(metric, timing)
+
+    def test_request_stats_for_staff_only(self):
+        """- Проверка страницы статистики запросов"""
+        self.client.get(reverse('posts:index'))
+        url = reverse('request_stats')
+        self.assertEqual(
+            self.client.get(url).status_code, HTTPStatus.FOUND)
+        staff = User.objects.create_user(username='staff', is_staff=True)
+        self.client.force_login(staff)
+        stats = self.client.get(url).json()
+        self.assertEqual(stats['views']['posts:index']['requests'], 1)
+        self.assertIn('fragments', stats['caches'])
+
+    @override_settings(QUERY_BUDGET_RAISE=True)
+    def test_query_budget_exceeded(self):
+        """- Проверка бюджета запросов вьюхи"""
+        with mock.patch.object(views.index, 'query_budget', 0):
+            with self.assertRaises(QueryBudgetExceeded), \
+                    self.assertLogs('core.metrics', 'WARNING'):
+                self.client.get(reverse('posts:index'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaRoutingTest(TestCase):
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.middleware = ReplicaRoutingMiddleware(lambda request: None)
+        self.router = db.ReplicaRouter()
+        db.note_sync(time.time())
+
+    def routed_alias(self, request, view=views.index):
+        with db.reading_from(None):
+            self.middleware.process_view(request, view, (), {})
+            return self.router.db_for_read(Post)
+
+    def test_read_views_use_replica(self):
+        """- Проверка чтения из реплики"""
+        request = self.factory.get('/')
+        self.assertEqual(self.routed_alias(request), 'replica1')
+        self.assertEqual(
+            self.routed_alias(request, views.post_create), db.PRIMARY)
+        self.assertEqual(self.router.db_for_write(Post), db.PRIMARY)
+        self.assertFalse(self.router.allow_migrate('replica1', 'posts'))
+        # Пользователи и сессии реплика может ещё не знать.
+        with db.reading_from('replica1'):
+            self.assertEqual(self.router.db_for_read(User), db.PRIMARY)
+
+    def test_stale_replica_is_not_used(self):
+        """- Проверка отказа от давно не обновлявшейся реплики"""
+        db.note_sync(time.time() - settings.REPLICA_PIN_SECONDS - 1)
+        self.assertEqual(self.routed_alias(self.factory.get('/')), db.PRIMARY)
+
+    def test_reads_stick_to_primary_after_write(self):
+        """- Проверка чтения своих записей из основной базы"""
+        response = self.client.post(reverse('users:login'), {})
+        self.assertIn(settings.REPLICA_PIN_COOKIE, response.cookies)
+        request = self.factory.get('/')
+        request.COOKIES[settings.REPLICA_PIN_COOKIE] = '1'
+        self.assertEqual(self.routed_alias(request), db.PRIMARY)
+
+    def test_no_caching_from_lagging_replica(self):
+        """- Проверка, что чтение из отстающей реплики не кэшируется"""
+        loads = []
+
+        def load(key):
+            loads.append(key)
+            return {'key': key}
+
+        cache = ObjectCache('replica-items', load)
+        cache.invalidate()
+        with db.reading_from('replica1'):
+            self.assertFalse(db.may_cache_reads())
+            cache.get('a')
+            cache.get('a')
+        self.assertEqual(loads, ['a', 'a'])
+        # Реплику скопировали после записи.
+        db.note_sync(time.time())
+        with db.reading_from('replica1'):
+            cache.get('a')
+            cache.get('a')
+        self.assertEqual(loads, ['a', 'a', 'a'])
+
+
+@override_settings(SQLITE_LOCK_RETRY_DELAY=0)
+class SQLiteModeTest(TransactionTestCase):
+    def test_connection_pragmas(self):
+        """- Проверка прагм соединения SQLite"""
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA busy_timeout')
+            self.assertEqual(
+                cursor.fetchone()[0],
+                settings.SQLITE_PRAGMAS['busy_timeout'])
+
+    def test_pragmas_are_not_view_queries(self):
+        """- Проверка, что прагмы не считаются запросами вьюхи"""
+        with self.assertNumQueries(0):
+            apply_pragmas(None, connection)
+
+    def test_retry_on_lock(self):
+        """- Проверка повтора вьюхи при блокировке базы"""
+        calls = []
+
+        @retry_on_lock
+        def view():
+            calls.append(1)
+            User.objects.create_user(username=f'user{len(calls)}')
+            if len(calls) < 3:
+                raise OperationalError('database is locked')
+            return 'ok'
+
+        with self.assertLogs('core.sqlite', 'WARNING'):
+            self.assertEqual(view(), 'ok')
+        self.assertEqual(len(calls), 3)
+        # Неудачные попытки откатились вместе со своими записями.
+        self.assertEqual(
+            list(User.objects.values_list('username', flat=True)),
+            ['user3'])
+
+    def test_online_backup(self):
+        """- Проверка онлайн-бэкапа базы"""
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        source_path = os.path.join(directory.name, 'source.sqlite3')
+        source = sqlite3.connect(source_path)
+        source.execute('PRAGMA journal_mode=WAL')
+        source.execute('CREATE TABLE item (value INTEGER)')
+        source.executemany(
+            'INSERT INTO item VALUES (?)', [(i,) for i in range(1000)])
+        source.commit()
+        target_path = os.path.join(directory.name, 'copy.sqlite3')
+        backup(source_path, target_path, pages=1, sleep=0)
+        source.close()
+        copy = sqlite3.connect(target_path)
+        self.addCleanup(copy.close)
+        self.assertEqual(
+            copy.execute('SELECT COUNT(*) FROM item').fetchone()[0], 1000)
+
+
+class ObjectCacheTest(TestCase):
+    def setUp(self):
+        self.loads = []
+
+        def load(key):
+            self.loads.append(key)
+            return {'key': key} if key != 'missing' else None
+
+        self.cache = ObjectCache('test-items', load, size=2)
+        self.cache.invalidate()
+
+    def test_read_through_and_lru(self):
+        """- Проверка двух уровней кэша объектов и вытеснения из LRU"""
+        item = self.cache.get('a')
+        item['key'] = 'испорчено'
+        self.assertEqual(self.cache.get('a'), {'key': 'a'})
+        self.assertIsNone(self.cache.get('missing'))
+        self.cache.get('b')
+        self.cache.get('c')
+        self.assertEqual(self.cache.stats()['size'], 2)
+        # Вытесненный из LRU объект берётся из общего кэша, не из базы.
+        self.cache.get('a')
+        self.assertEqual(self.loads, ['a', 'missing', 'b', 'c'])
+        self.assertEqual(self.cache.stats()['hits'], 1)
+
+    def test_version_broadcast(self):
+        """- Проверка сброса кэша объектов из другого процесса"""
+        self.cache.get('a')
+        self.cache.check_interval = 0
+        # Другой процесс меняет версию в общем кэше счётчиков.
+        caches['counters'].incr(self.cache._version_key)
+        self.cache.get('a')
+        self.assertEqual(self.loads, ['a', 'a'])
+        self.cache.invalidate()
+        self.cache.get('a')
+        self.assertEqual(self.loads, ['a', 'a', 'a'])
+
+    def test_key_invalidation_broadcast(self):
+        """- Проверка сброса одного объекта в другом процессе"""
+        other = ObjectCache('test-items', self.cache.loader, size=2)
+        self.cache.get('a')
+        self.cache.get('b')
+        other.get('a')
+        other.get('b')
+        self.assertEqual(self.loads, ['a', 'b'])
+        other.check_interval = 0
+        self.cache.invalidate_key('a')
+        other.get('a')
+        other.get('b')
+        self.assertEqual(self.loads, ['a', 'b', 'a'])
+
+    def test_negative_cache(self):
+        """- Проверка кэширования отсутствующих объектов"""
+        self.assertIsNone(self.cache.get('missing'))
+        with self.assertRaises(CachedNotFound):
+            self.cache.get_or_404('missing')
+        self.assertEqual(self.loads, ['missing'])
+        self.assertEqual(self.cache.stats()['negative_hits'], 1)
+        # Создание объекта сбрасывает версию, а с ней и промах.
+        self.cache.invalidate()
+        self.assertIsNone(self.cache.get('missing'))
+        self.assertEqual(self.loads, ['missing', 'missing'])
+
+    def test_missing_profile_is_cached(self):
+        """- Проверка готовой страницы 404 для несуществующего автора"""
+        url = reverse('posts:profile', kwargs={'username': 'ghost'})
+        self.assertEqual(self.client.get(url).status_code, 404)
+        with self.assertNumQueries(0):
+            response = self.client.get(url)
+        self.assertContains(response, url, status_code=404)
+        User.objects.create_user(username='ghost')
+        self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_views_use_object_cache(self):
+        """- Проверка кэша групп и авторов во вьюхах"""
+        author = User.objects.create_user(username='cached')
+        url = reverse('posts:profile', kwargs={'username': 'cached'})
+        self.client.get(url)
+        caches['pages'].clear()
+        with self.assertNumQueries(1):
+            self.client.get(url)
+        Post.objects.create(author=author, text='Новый пост')
+        caches['pages'].clear()
+        response = self.client.get(url)
+        self.assertEqual(response.context['posts_count'], 1)
+        # Вход меняет только last_login и кэш авторов не сбрасывает.
+        version = author_cache.version()
+        self.client.force_login(author)
+        self.assertEqual(author_cache.version(), version)
+        with self.assertNumQueries(0):
+            cached = author_cache.get('cached')
+        self.assertIn('password', cached.get_deferred_fields())
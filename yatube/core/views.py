@@ -1,12 +1,43 @@
+from django.contrib.admin.views.decorators import staff_member_required
+from django.contrib.auth import SESSION_KEY
+from django.http import HttpResponseNotFound, JsonResponse
 from django.shortcuts import render
+from django.template.loader import render_to_string
+from django.utils.html import escape
+
+from .cache import cache_stats
+from .metrics import rolling_stats
+from .objectcache import CachedNotFound, object_cache_stats
+
+# Метка пути в заранее отрисованной странице 404.
+NOT_FOUND_PATH = 'yatube-not-found-path'
+_not_found_page = None
 
 
 def page_not_found(request, exception):
     # Переменная exception содержит отладочную информацию;
     # выводить её в шаблон пользовательской страницы 404 мы не станем
+    if (isinstance(exception, CachedNotFound)
+            and not request.session.get(SESSION_KEY)):
+        return HttpResponseNotFound(
+            not_found_page(request).replace(
+                NOT_FOUND_PATH, escape(request.path)))
     return render(request, 'core/404.html', {'path': request.path}, status=404)
 
 
+def not_found_page(request):
+    """Страница 404 для гостя, отрисованная один раз на процесс.
+
+    Ей отвечают на известные из кэша промахи: перебор выдуманных адресов
+    не должен стоить ни запроса к базе, ни рендеринга шаблона.
+    """
+    global _not_found_page
+    if _not_found_page is None:
+        _not_found_page = render_to_string(
+            'core/404.html', {'path': NOT_FOUND_PATH}, request)
+    return _not_found_page
+
+
 def csrf_failure(request, reason=''):
     return render(request, 'core/403csrf.html')
 
@@ -17,3 +48,12 @@ def permission_denied(request, exception):
 
 def server_error(request):
     return render(request, 'core/500.html', status=500)
+
+
+@staff_member_required
+def request_stats(request):
+    return JsonResponse({
+        'views': rolling_stats(),
+        'caches': cache_stats(),
+        'objects': object_cache_stats(),
+    }, json_dumps_params={'ensure_ascii': False, 'indent': 2})
@@ -1,6 +1,7 @@
 from django.contrib import admin
 
 from .models import Post, Group
+from .search import get_search_backend
 
 
 class PostAdmin(admin.ModelAdmin):
@@ -16,6 +17,14 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ('pub_date',)
     empty_value_display = '-пусто-'
 
+    def get_search_results(self, request, queryset, search_term):
+        if not search_term:
+            return queryset, False
+        return (
+            get_search_backend().filter_queryset(queryset, search_term),
+            False,
+        )
+
 
 class GroupAdmin(admin.ModelAdmin):
     list_display = ('pk', 'title', 'slug', 'description')
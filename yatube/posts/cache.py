@@ -0,0 +1,206 @@
+import hashlib
+import time
+import zlib
+from datetime import datetime, timezone
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import SESSION_KEY
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+from django.views.decorators.http import condition
+from core.db import may_cache_reads, note_write
+
+from .models import Group
+
+FEED_GENERATION_KEY = 'posts:feed_generation'
+FEED_MODIFIED_KEY = 'posts:feed_modified'
+
+
+def _fresh_generation():
+    # Если счётчик вытеснен из кэша, новое значение не должно совпасть
+    # ни с одним из прежних, иначе оживут устаревшие фрагменты.
+    return time.time_ns()
+
+
+def _version(key, timeout=None):
+    counters = caches['counters']
+    version = counters.get(key)
+    if version is None:
+        counters.add(key, _fresh_generation(), timeout)
+        version = counters.get(key)
+    return version
+
+
+def _now_and_on_commit(func):
+    # Читатель между сбросом и коммитом положит в кэш старое
+    # содержимое под новой версией - после коммита сбрасываем снова.
+    func()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(func)
+
+
+def _increment(key, timeout):
+    note_write()
+    counters = caches['counters']
+    try:
+        counters.incr(key)
+    except ValueError:
+        counters.set(key, _fresh_generation(), timeout)
+
+
+def _bump(key, timeout=None):
+    _now_and_on_commit(lambda: _increment(key, timeout))
+
+
+def feed_generation():
+    """Текущее поколение содержимого лент для ключей кэша фрагментов."""
+    return _version(FEED_GENERATION_KEY)
+
+
+def bump_feed_generation():
+    """Инвалидирует все закэшированные фрагменты лент."""
+    _bump(FEED_GENERATION_KEY)
+    _now_and_on_commit(lambda: caches['counters'].set(
+        FEED_MODIFIED_KEY, time.time(), None))
+
+
+def feed_cache_context():
+    """Переменные шаблона для тега `{% cache %}` вокруг ленты."""
+    return {
+        'feed_generation': feed_generation(),
+        # Нулевой срок: фрагмент из отстающей реплики в кэш не попадёт.
+        'feed_cache_timeout':
+            settings.FEED_CACHE_TIMEOUT if may_cache_reads() else 0,
+    }
+
+
+def follows_scope(user_id):
+    """Область подписок пользователя: от неё зависят кнопки подписки."""
+    return f'follows:{user_id}'
+
+
+def page_etag(scope_func=None):
+    """ETag страницы: версия её области, адрес и пользователь.
+
+    Без `scope_func` вместо версии области берётся общее поколение лент.
+    Для вошедшего пользователя в ETag входит и версия его подписок.
+    Пользователь берётся из сессии, а не из базы: ответ 304 не делает
+    ни одного запроса к базе.
+    """
+    def etag(request, *args, **kwargs):
+        if scope_func is None:
+            version = feed_generation()
+        else:
+            version = _scope_version(scope_func(**kwargs))
+        user_id = request.session.get(SESSION_KEY, '')
+        follows_version = (
+            _scope_version(follows_scope(user_id)) if user_id else '')
+        key = ':'.join(map(str, (
+            settings.ETAG_VERSION,
+            version,
+            request.get_full_path(),
+            user_id,
+            follows_version,
+        )))
+        return hashlib.md5(key.encode()).hexdigest()
+    return etag
+
+
+def feed_last_modified(request, *args, **kwargs):
+    modified = caches['counters'].get(FEED_MODIFIED_KEY)
+    if modified is None:
+        return None
+    return datetime.fromtimestamp(modified, timezone.utc)
+
+
+def conditional_page(view_func):
+    """Условный GET для страниц с постами: 304 без запросов и рендеринга.
+
+    Если ниже стоит `anonymous_page_cache`, ETag зависит от версии области
+    страницы, и комментарий к одному посту не сбрасывает валидаторы
+    остальных страниц.
+    """
+    return condition(
+        etag_func=page_etag(getattr(view_func, 'page_scope', None)),
+        last_modified_func=feed_last_modified,
+    )(view_func)
+
+
+def _digest(text):
+    # Слаги и имена пользователей бывают кириллическими, а memcached
+    # принимает в ключах только ASCII без пробелов.
+    return hashlib.md5(text.encode()).hexdigest()
+
+
+def _scope_key(scope):
+    return f'posts:page_scope:{_digest(scope)}'
+
+
+def _scope_version(scope):
+    # Областей столько же, сколько постов и авторов: версии живут
+    # ограниченное время. Истёкшая версия сменится на новую, и
+    # страницы области просто перестроятся.
+    return _version(_scope_key(scope), settings.PAGE_SCOPE_TIMEOUT)
+
+
+def post_page_scopes(post, group_ids=(), usernames=()):
+    """Области страниц, где виден пост: лента, профиль, группа, сам пост."""
+    group_ids = {post.group_id, *group_ids} - {None}
+    return [
+        'index',
+        f'post:{post.pk}',
+        *(f'profile:{username}'
+          for username in {post.author.username, *usernames}),
+        *(f'group:{slug}' for slug in Group.objects.filter(
+            pk__in=group_ids).values_list('slug', flat=True)),
+    ]
+
+
+def purge_pages(*scopes):
+    """Сбрасывает закэшированные страницы перечисленных областей."""
+    for scope in scopes:
+        _bump(_scope_key(scope), settings.PAGE_SCOPE_TIMEOUT)
+
+
+def anonymous_page_cache(scope_func):
+    """Кэширует ответ вьюхи целиком для анонимных посетителей.
+
+    `scope_func(**kwargs)` называет область страницы (например,
+    `profile:leo`); `purge_pages()` сбрасывает все страницы области
+    сменой её версии. Тело хранится сжатым zlib.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if (request.method not in ('GET', 'HEAD')
+                    or request.session.get(SESSION_KEY)):
+                return view_func(request, *args, **kwargs)
+            scope = scope_func(**kwargs)
+            key = ':'.join((
+                _digest(scope),
+                str(_scope_version(scope)),
+                _digest(request.get_full_path()),
+            ))
+            pages = caches['pages']
+            cached = pages.get(key)
+            if cached is not None:
+                content_type, body = cached
+                response = HttpResponse(
+                    zlib.decompress(body), content_type=content_type)
+                response['X-Page-Cache'] = 'hit'
+                return response
+            response = view_func(request, *args, **kwargs)
+            # Ответ с cookie (например, CSRF) общим для всех быть не может.
+            if (response.status_code == 200 and not response.cookies
+                    and may_cache_reads()):
+                pages.set(key, (
+                    response['Content-Type'],
+                    zlib.compress(response.content, settings.PAGE_CACHE_LEVEL),
+                ))
+                response['X-Page-Cache'] = 'miss'
+            return response
+        wrapper.page_scope = scope_func
+        return wrapper
+    return decorator
@@ -0,0 +1,142 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DatabaseError, connections, router
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from .lookups import author_cache, invalidate_authors, post_cache
+from .models import Comment, Follow, Post, User, UserStats
+
+
+def _deltas(**deltas):
+    return {field: F(field) + delta for field, delta in deltas.items()}
+
+
+def _no_underflow(**deltas):
+    # Счётчики беззнаковые: устаревший счётчик не должен уйти в минус.
+    return {
+        f'{field}__gte': -delta for field, delta in deltas.items()
+        if delta < 0
+    }
+
+
+def bump_user_stats(user_id, create=True, **deltas):
+    """Атомарно сдвигает счётчики пользователя на заданные величины.
+
+    При удалении (`create=False`) строку не создаём: пользователь
+    может удаляться в этой же транзакции каскадом.
+    """
+    invalidate_authors(user_id)
+    updated = UserStats.objects.filter(
+        user_id=user_id, **_no_underflow(**deltas)
+    ).update(**_deltas(**deltas))
+    if updated or not create:
+        return
+    _, created = UserStats.objects.get_or_create(
+        user_id=user_id,
+        defaults={field: max(delta, 0) for field, delta in deltas.items()},
+    )
+    if not created:
+        UserStats.objects.filter(user_id=user_id).update(**_deltas(**deltas))
+
+
+def bump_comments_count(post_id, delta):
+    post_cache.invalidate_key(post_id)
+    Post.objects.filter(
+        pk=post_id, **_no_underflow(comments_count=delta)
+    ).update(**_deltas(comments_count=delta))
+
+
+def get_user_stats(user):
+    """Счётчики пользователя; для пользователя без строки - нули."""
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def _count(queryset, field):
+    return Coalesce(Subquery(
+        queryset.filter(**{field: OuterRef('pk')})
+        .order_by()
+        .values(field)
+        .annotate(total=Count('pk'))
+        .values('total')
+    ), 0)
+
+
+def rebuild_counters():
+    """Пересчитывает все счётчики пакетными UPDATE ... SELECT."""
+    author_cache.invalidate()
+    post_cache.invalidate()
+    UserStats.objects.bulk_create(
+        (UserStats(user_id=pk)
+         for pk in User.objects.filter(stats__isnull=True)
+         .values_list('pk', flat=True).iterator()),
+        batch_size=500,
+    )
+    UserStats.objects.update(
+        posts_count=_count(Post.objects.all(), 'author'),
+        followers_count=_count(Follow.objects.all(), 'author'),
+        following_count=_count(Follow.objects.all(), 'user'),
+    )
+    Post.objects.update(comments_count=_count(Comment.objects.all(), 'post'))
+
+
+def refresh_follow_counts(user_id, author_ids):
+    """Пересчитывает счётчики подписок после пакетной (не)подписки.
+
+    Полный пересчёт, а не сдвиг: так он верен и при гонке с другими
+    запросами того же пользователя.
+    """
+    invalidate_authors(user_id, *author_ids)
+    UserStats.objects.filter(user_id=user_id).update(
+        following_count=_count(Follow.objects.all(), 'user'))
+    UserStats.objects.filter(user_id__in=author_ids).update(
+        followers_count=_count(Follow.objects.all(), 'author'))
+
+
+def table_rows(model):
+    """Число строк таблицы по статистике СУБД; None, если её нет.
+
+    SQLite ведёт статистику в `sqlite_stat1` после `ANALYZE`,
+    PostgreSQL - в `pg_class.reltuples` после `ANALYZE` или автовакуума.
+    """
+    connection = connections[router.db_for_read(model)]
+    table = model._meta.db_table
+    queries = {
+        'sqlite': 'SELECT stat FROM sqlite_stat1 WHERE tbl = %s',
+        'postgresql': 'SELECT reltuples FROM pg_class WHERE relname = %s',
+    }
+    if connection.vendor not in queries:
+        return None
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute(queries[connection.vendor], [table])
+            row = cursor.fetchone()
+    except DatabaseError:
+        # sqlite_stat1 появляется только после первого ANALYZE.
+        return None
+    if row is None:
+        return None
+    rows = int(float(str(row[0]).split()[0]))
+    return rows if rows >= 0 else None
+
+
+def estimated_count(key, queryset):
+    """Примерное число строк для окна пагинации.
+
+    Для всей таблицы берётся статистика СУБД, для выборки - `COUNT(*)`;
+    результат кэшируется на `COUNT_CACHE_TIMEOUT`, так что страницы
+    обычно обходятся без подсчёта вовсе.
+    """
+    cache = caches['default']
+    cache_key = f'posts:count:{key}'
+    count = cache.get(cache_key)
+    if count is None:
+        if not queryset.query.where:
+            count = table_rows(queryset.model)
+        if count is None:
+            count = queryset.count()
+        cache.set(cache_key, count, settings.COUNT_CACHE_TIMEOUT)
+    return count
@@ -0,0 +1,111 @@
+"""Ленты RSS и Atom: вся лента сайта, группы и авторы.
+
+XML пишет SAX-генератор `feedgenerator` прямо в ответ, без шаблонов.
+Готовый ответ лежит в кэше страниц до изменения содержимого области,
+а условный GET отвечает читалкам 304 без обращения к базе.
+"""
+from django.conf import settings
+from django.contrib.syndication.views import Feed
+from django.urls import reverse
+from django.utils.feedgenerator import Atom1Feed
+from django.utils.text import Truncator
+from core.db import replica_reads
+
+from .cache import anonymous_page_cache, conditional_page
+from .lookups import author_cache, group_cache
+from .models import Post
+
+
+class PostFeed(Feed):
+    title = 'Yatube: последние обновления'
+    description = 'Новые записи на сайте'
+
+    def link(self, obj=None):
+        return reverse('posts:index')
+
+    def posts(self, obj):
+        return Post.objects.all()
+
+    def items(self, obj=None):
+        return self.posts(obj).for_feed()[:settings.FEED_ITEMS]
+
+    def item_title(self, item):
+        return Truncator(item.text).chars(settings.FEED_TITLE_LENGTH)
+
+    def item_description(self, item):
+        return item.text
+
+    def item_link(self, item):
+        return reverse('posts:post_detail', kwargs={'post_id': item.pk})
+
+    def item_pubdate(self, item):
+        return item.pub_date
+
+    def item_author_name(self, item):
+        return item.author.get_full_name() or item.author.username
+
+    def item_categories(self, item):
+        return (item.group.title,) if item.group else ()
+
+
+class GroupFeed(PostFeed):
+    def get_object(self, request, slug):
+        return group_cache.get_or_404(slug)
+
+    def title(self, obj):
+        return f'Yatube: {obj.title}'
+
+    def description(self, obj):
+        return obj.description
+
+    def link(self, obj):
+        return reverse('posts:group_list', kwargs={'slug': obj.slug})
+
+    def posts(self, obj):
+        return obj.posts.all()
+
+
+class AuthorFeed(PostFeed):
+    def get_object(self, request, username):
+        return author_cache.get_or_404(username)
+
+    def title(self, obj):
+        return f'Yatube: записи {obj.get_full_name() or obj.username}'
+
+    def link(self, obj):
+        return reverse('posts:profile', kwargs={'username': obj.username})
+
+    def posts(self, obj):
+        return obj.posts.all()
+
+
+def atom(feed_class):
+    return type(f'Atom{feed_class.__name__}', (feed_class,), {
+        'feed_type': Atom1Feed,
+        'subtitle': feed_class.description,
+    })
+
+
+def feed_view(feed_class, scope_func):
+    return replica_reads(conditional_page(
+        anonymous_page_cache(scope_func)(feed_class())))
+
+
+def index_scope():
+    return 'index'
+
+
+def group_scope(slug):
+    return f'group:{slug}'
+
+
+def profile_scope(username):
+    return f'profile:{username}'
+
+
+index_rss = feed_view(PostFeed, index_scope)
+index_atom = feed_view(atom(PostFeed), index_scope)
+group_rss = feed_view(GroupFeed, group_scope)
+group_atom = feed_view(atom(GroupFeed), group_scope)
+profile_rss = feed_view(AuthorFeed, profile_scope)
+profile_atom = feed_view(atom(AuthorFeed), profile_scope)
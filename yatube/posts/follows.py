@@ -0,0 +1,142 @@
+"""Операции над графом подписок.
+
+Одиночные подписка и отписка - это один INSERT или DELETE: повторы
+и гонки разрешает уникальный индекс (user, author). Пакетные операции
+идут в обход сигналов, поэтому счётчики, ленты и поколение лент
+обновляют сами.
+"""
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import IntegrityError, connection, transaction
+from core.db import may_cache_reads
+
+from .cache import bump_feed_generation, follows_scope, purge_pages
+from .counters import refresh_follow_counts
+from .models import Follow, User
+from .timeline import get_timeline_backend
+
+BATCH_SIZE = 500
+
+
+def _follow_set_key(user_id):
+    return f'posts:follow_set:{user_id}'
+
+
+def _find(ids, author_id):
+    index = bisect_left(ids, author_id)
+    return index, index < len(ids) and ids[index] == author_id
+
+
+def following_ids(user):
+    """Отсортированный массив id авторов, на которых подписан пользователь.
+
+    В кэше лежат байты `array('I')` - по 4 байта на подписку, `AutoField`
+    32-битный. На объекте пользователя массив живёт до конца запроса,
+    так что проверки для всех авторов страницы стоят одного чтения кэша.
+    """
+    ids = getattr(user, '_following_ids', None)
+    if ids is not None:
+        return ids
+    cache = caches['default']
+    ids = array('I')
+    data = cache.get(_follow_set_key(user.pk))
+    if data is None:
+        ids.extend(
+            Follow.objects.filter(user_id=user.pk).order_by('author_id')
+            .values_list('author_id', flat=True))
+        if may_cache_reads():
+            cache.set(_follow_set_key(user.pk), ids.tobytes(),
+                      settings.FOLLOW_SET_TIMEOUT)
+    else:
+        ids.frombytes(data)
+    user._following_ids = ids
+    return ids
+
+
+def is_following(user, author_id):
+    if not user.is_authenticated:
+        return False
+    return _find(following_ids(user), author_id)[1]
+
+
+def drop_follow_set(user_id):
+    """Сбрасывает массив подписок сразу и ещё раз после коммита.
+
+    До коммита другой запрос может перечитать из базы старые подписки
+    и положить их в кэш; второй сброс убирает такой массив.
+    """
+    key = _follow_set_key(user_id)
+    caches['default'].delete(key)
+    transaction.on_commit(lambda: caches['default'].delete(key))
+    # Кнопки подписки на страницах пользователя устарели вместе с ETag.
+    purge_pages(follows_scope(user_id))
+
+
+def follow(user, author):
+    """Подписывает на автора; возвращает True, если подписка новая."""
+    if user.pk == author.pk:
+        return False
+    try:
+        with transaction.atomic():
+            Follow.objects.create(user=user, author=author)
+    except IntegrityError:
+        return False
+    return True
+
+
+def unfollow(user, username):
+    """Отписывает от автора; отписка без подписки - не ошибка."""
+    deleted, _ = user.follower.filter(author__username=username).delete()
+    return bool(deleted)
+
+
+def _after_bulk(user, author_ids, timeline_method):
+    if not author_ids:
+        return
+    refresh_follow_counts(user.pk, author_ids)
+    timeline_method(user.pk, author_ids)
+    drop_follow_set(user.pk)
+    bump_feed_generation()
+    usernames = User.objects.filter(
+        pk__in=author_ids).values_list('username', flat=True)
+    purge_pages(f'profile:{user.username}',
+                *(f'profile:{username}' for username in usernames))
+
+
+@transaction.atomic
+def bulk_follow(user, authors):
+    """Подписывает на всех авторов из QuerySet пакетными INSERT.
+
+    Возвращает число новых подписок.
+    """
+    author_ids = list(
+        authors.exclude(pk=user.pk).exclude(following__user=user)
+        .values_list('pk', flat=True))
+    Follow.objects.bulk_create(
+        (Follow(user=user, author_id=pk) for pk in author_ids),
+        batch_size=BATCH_SIZE, ignore_conflicts=True)
+    _after_bulk(user, author_ids, get_timeline_backend().follow_many)
+    return len(author_ids)
+
+
+@transaction.atomic
+def bulk_unfollow(user, authors):
+    """Отписывает от всех авторов из QuerySet одним DELETE.
+
+    Возвращает число удалённых подписок.
+    """
+    follows = user.follower.filter(author__in=authors)
+    author_ids = list(follows.values_list('author_id', flat=True))
+    if not author_ids:
+        return 0
+    select_sql, params = follows.values('pk').query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {Follow._meta.db_table} WHERE id IN ({select_sql})',
+            params)
+        deleted = cursor.rowcount
+    _after_bulk(user, author_ids, get_timeline_backend().unfollow_many)
+    return deleted
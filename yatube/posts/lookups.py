@@ -0,0 +1,41 @@
+"""Кэшированные выборки групп, авторов и постов для вьюх чтения.
+
+Объекты берутся из `core.objectcache.ObjectCache` и сбрасываются
+по ключу обработчиками сигналов и функциями счётчиков при любом
+изменении, видимом в кэшированном объекте, включая `UserStats` и
+`Post.comments_count`. Счётчики автора лежат только в кэше авторов:
+в кэше постов их пришлось бы сбрасывать у всех постов автора.
+
+Загружаются только выводимые поля: пароль, почта и прочие колонки
+`auth_user` в общий кэш не попадают.
+"""
+from core.objectcache import ObjectCache
+
+from .models import Group, Post, User
+
+
+def _load_group(slug):
+    return Group.objects.filter(slug=slug).first()
+
+
+def _load_author(username):
+    return User.objects.select_related('stats').only(
+        'id', 'username', 'first_name', 'last_name', 'stats',
+    ).filter(username=username).first()
+
+
+def _load_post(post_id):
+    return Post.objects.for_feed().filter(pk=post_id).first()
+
+
+group_cache = ObjectCache('group', _load_group)
+author_cache = ObjectCache('author', _load_author)
+post_cache = ObjectCache('post', _load_post)
+
+
+def invalidate_authors(*user_ids):
+    """Сбрасывает авторов по id: ключ их кэша - имя пользователя."""
+    usernames = User.objects.filter(pk__in=user_ids).values_list(
+        'username', flat=True)
+    for username in usernames:
+        author_cache.invalidate_key(username)
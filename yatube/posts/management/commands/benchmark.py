@@ -0,0 +1,201 @@
+import json
+import math
+import platform
+import time
+from contextlib import ExitStack
+
+import django
+from django.core.cache import caches
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+from django.db.models import Count
+from django.test import Client
+from django.test.utils import (CaptureQueriesContext, setup_databases,
+                               setup_test_environment, teardown_databases,
+                               teardown_test_environment)
+from django.urls import reverse
+from django.utils import timezone
+
+from posts.models import Group, Post, User
+from posts.seeding import Seeder
+
+# Размеры наборов данных: пользователи, группы, посты, комментарии, подписки.
+SIZES = {
+    'tiny': (200, 5, 1000, 2000, 2000),
+    'small': (2000, 20, 10000, 30000, 20000),
+    'large': (50000, 200, 1000000, 2000000, 500000),
+}
+FIELDS = ('users', 'groups', 'posts', 'comments', 'follows')
+
+
+def percentile(values, percent):
+    """Перцентиль методом ближайшего ранга."""
+    values = sorted(values)
+    return values[max(0, math.ceil(len(values) * percent / 100) - 1)]
+
+
+def summarize(durations, queries):
+    return {
+        'p50_ms': round(percentile(durations, 50) * 1000, 2),
+        'p95_ms': round(percentile(durations, 95) * 1000, 2),
+        'p99_ms': round(percentile(durations, 99) * 1000, 2),
+        'mean_ms': round(sum(durations) / len(durations) * 1000, 2),
+        'queries': max(queries),
+    }
+
+
+def compare(results, baseline, tolerance):
+    """Сценарии, где p95 или число запросов выросли сверх допуска."""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get(name)
+        if previous is None:
+            continue
+        if current['p95_ms'] > previous['p95_ms'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {previous["p95_ms"]} -> {current["p95_ms"]} мс')
+        if current['queries'] > previous['queries']:
+            regressions.append(
+                f'{name}: запросов {previous["queries"]} -> '
+                f'{current["queries"]}')
+    return regressions
+
+
+class Command(BaseCommand):
+    help = ('Замеряет вьюхи постов на синтетических данных во временной '
+            'тестовой базе и сравнивает результат с базовым')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--size', choices=SIZES, default='small',
+            help='Готовый размер набора данных')
+        for field in FIELDS:
+            parser.add_argument(
+                f'--{field}', type=int,
+                help=f'Переопределить число: {field}')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--requests', type=int, default=50,
+            help='Замеров на сценарий')
+        parser.add_argument('--warmup', type=int, default=5)
+        parser.add_argument(
+            '--output', help='Куда сохранить результаты в JSON')
+        parser.add_argument(
+            '--baseline', help='JSON прошлого прогона для сравнения')
+        parser.add_argument(
+            '--tolerance', type=float, default=0.2,
+            help='Допустимый рост p95 относительно базового, доля')
+
+    def handle(self, *args, **options):
+        sizes = dict(zip(FIELDS, SIZES[options['size']]))
+        for field in FIELDS:
+            if options[field] is not None:
+                sizes[field] = options[field]
+        baseline = None
+        if options['baseline']:
+            with open(options['baseline']) as file:
+                baseline = json.load(file)['results']
+
+        setup_test_environment()
+        # Реплики в тестовом окружении - зеркала временной базы.
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            started = time.perf_counter()
+            created = Seeder(options['seed']).run(**sizes)
+            self.stdout.write(
+                f'Данные созданы за {time.perf_counter() - started:.1f} с: '
+                f'{created}')
+            results = self.run_scenarios(
+                options['requests'], options['warmup'])
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            teardown_test_environment()
+
+        for name, result in results.items():
+            self.stdout.write(
+                f'{name:24} p50 {result["p50_ms"]:8.2f}  '
+                f'p95 {result["p95_ms"]:8.2f}  p99 {result["p99_ms"]:8.2f} '
+                f' мс, запросов {result["queries"]}')
+        if options['output']:
+            with open(options['output'], 'w') as file:
+                json.dump({
+                    'date': timezone.now().isoformat(),
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'database': connection.vendor,
+                    'seed': options['seed'],
+                    'sizes': sizes,
+                    'results': results,
+                }, file, ensure_ascii=False, indent=2)
+        if baseline is not None:
+            regressions = compare(results, baseline, options['tolerance'])
+            if regressions:
+                raise CommandError(
+                    'Регрессии относительно базового прогона:\n'
+                    + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий нет'))
+
+    def scenarios(self):
+        """Самые тяжёлые страницы каждой вьюхи на созданных данных."""
+        author = User.objects.annotate(
+            total=Count('posts')).order_by('-total').first()
+        reader = User.objects.annotate(
+            total=Count('follower')).order_by('-total').first()
+        group = Group.objects.annotate(
+            total=Count('posts')).order_by('-total').first()
+        post = Post.objects.order_by('-comments_count').first()
+        scenarios = {
+            'index': (None, reverse('posts:index')),
+            'index_page_50': (None, reverse('posts:index') + '?page=50'),
+            'api_index': (None, reverse('api:index')),
+            'feed': (None, reverse('posts:feed')),
+        }
+        if group is not None:
+            scenarios['group_posts'] = (None, reverse(
+                'posts:group_list', kwargs={'slug': group.slug}))
+        if author is not None:
+            scenarios['profile'] = (None, reverse(
+                'posts:profile', kwargs={'username': author.username}))
+        if post is not None:
+            scenarios['post_detail'] = (None, reverse(
+                'posts:post_detail', kwargs={'post_id': post.pk}))
+        if post is not None:
+            scenarios['api_post_detail'] = (None, reverse(
+                'api:post_detail', kwargs={'post_id': post.pk}))
+        if reader is not None:
+            scenarios['follow_index'] = (reader, reverse(
+                'posts:follow_index'))
+            scenarios['api_follow_index'] = (reader, reverse(
+                'api:follow_index'))
+        return scenarios
+
+    def run_scenarios(self, requests, warmup):
+        results = {}
+        for name, (user, url) in self.scenarios().items():
+            client = Client()
+            if user is not None:
+                client.force_login(user)
+            # Холодный прогон - без кэша страниц и фрагментов, тёплый - с ним.
+            for mode, cold in (('cold', True), ('warm', False)):
+                durations = []
+                queries = []
+                for number in range(warmup + requests):
+                    if cold:
+                        caches['fragments'].clear()
+                        caches['pages'].clear()
+                    with ExitStack() as stack:
+                        captured = [
+                            stack.enter_context(CaptureQueriesContext(db))
+                            for db in connections.all()
+                        ]
+                        started = time.perf_counter()
+                        response = client.get(url)
+                        duration = time.perf_counter() - started
+                    if response.status_code != 200:
+                        raise CommandError(
+                            f'{url}: ответ {response.status_code}')
+                    if number >= warmup:
+                        durations.append(duration)
+                        queries.append(sum(map(len, captured)))
+                results[f'{name}/{mode}'] = summarize(durations, queries)
+        return results
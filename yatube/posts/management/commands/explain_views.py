@@ -0,0 +1,126 @@
+import inspect
+import re
+from contextlib import ExitStack
+
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections, transaction
+from django.test import RequestFactory
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, reverse
+
+from posts import urls, views
+from posts.models import Follow, Group, Post, User
+
+EXPLAIN = {
+    'sqlite': 'EXPLAIN QUERY PLAN ',
+    'postgresql': 'EXPLAIN ',
+}
+# Полный проход по таблице и сортировка во временном B-дереве (SQLite),
+# последовательное чтение и сортировка (PostgreSQL).
+WARNINGS = (
+    (re.compile(r'^SCAN (TABLE )?(?!CONSTANT\b)\w+( AS \w+)?$'),
+     'полный проход'),
+    (re.compile(r'USE TEMP B-TREE'), 'сортировка во временном B-дереве'),
+    (re.compile(r'Seq Scan'), 'полный проход'),
+    (re.compile(r'\bSort\b'), 'сортировка'),
+)
+STATISTICS = re.compile(r'\b(sqlite_stat1|pg_class)\b')
+
+
+def plan_warnings(plan):
+    return sorted({
+        message
+        for line in plan
+        for pattern, message in WARNINGS
+        if pattern.search(line.strip())
+    })
+
+
+class Command(BaseCommand):
+    help = ('Выполняет запросы каждой вьюхи чтения из posts.views '
+            'и печатает их планы, отмечая полные проходы и сортировки')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--strict', action='store_true',
+            help='Завершиться ошибкой, если есть предупреждения')
+
+    def handle(self, *args, **options):
+        samples = self.samples()
+        warned = 0
+        for pattern in urls.urlpatterns:
+            view = pattern.callback
+            # Вьюхи чтения помечены бюджетом запросов, записи - нет.
+            if (not isinstance(pattern, URLPattern)
+                    or getattr(views, view.__name__, None) is not view
+                    or not hasattr(view, 'query_budget')):
+                continue
+            try:
+                kwargs = {name: samples[name]
+                          for name in pattern.pattern.converters}
+            except KeyError as error:
+                self.stderr.write(
+                    f'{pattern.name}: нет данных для {error}, пропущено')
+                continue
+            url = reverse(f'posts:{pattern.name}', kwargs=kwargs)
+            self.stdout.write(self.style.MIGRATE_HEADING(url))
+            for alias, sql in self.replay(view, url, kwargs, samples):
+                plan = self.explain(alias, sql)
+                problems = plan_warnings(plan)
+                warned += bool(problems)
+                self.stdout.write(f'  {sql[:200]}')
+                for line in plan:
+                    self.stdout.write(f'    {line}')
+                for problem in problems:
+                    self.stdout.write(self.style.WARNING(f'    ! {problem}'))
+        if warned and options['strict']:
+            raise CommandError(f'Запросов с предупреждениями: {warned}')
+
+    def samples(self):
+        """Значения параметров URL, для которых в базе есть данные."""
+        samples = {'q': 'пост'}
+        group = Group.objects.filter(posts__isnull=False).first()
+        if group is not None:
+            samples['slug'] = group.slug
+        post = Post.objects.select_related('author').first()
+        if post is not None:
+            samples['post_id'] = post.pk
+            samples['username'] = post.author.username
+            samples['q'] = post.text.split()[0] if post.text else 'пост'
+        follow = Follow.objects.select_related('user').first()
+        samples['user'] = follow.user if follow else User.objects.first()
+        return samples
+
+    def replay(self, view, url, kwargs, samples):
+        """SQL-запросы вьюхи без кэшей и декораторов, с откатом."""
+        request = RequestFactory().get(url, {'q': samples['q']})
+        request.user = samples['user'] or AnonymousUser()
+        request.session = {}
+        with ExitStack() as stack:
+            captured = [
+                (connection.alias,
+                 stack.enter_context(CaptureQueriesContext(connection)))
+                for connection in connections.all()
+            ]
+            with transaction.atomic():
+                inspect.unwrap(view)(request, **kwargs)
+                transaction.set_rollback(True)
+        return [
+            (alias, query['sql'])
+            for alias, queries in captured
+            for query in queries
+            if query['sql'].lstrip().upper().startswith('SELECT')
+            # Статистика таблиц для примерных счётчиков - не запрос вьюхи.
+            and not STATISTICS.search(query['sql'])
+        ]
+
+    def explain(self, alias, sql):
+        connection = connections[alias]
+        if connection.vendor not in EXPLAIN:
+            raise CommandError(
+                f'План запроса для {connection.vendor} не поддерживается')
+        with connection.cursor() as cursor:
+            cursor.execute(EXPLAIN[connection.vendor] + sql)
+            # Текст шага плана - последний столбец у обеих СУБД.
+            return [str(row[-1]) for row in cursor.fetchall()]
@@ -0,0 +1,30 @@
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.thumbnails import generate_thumbnails, thumbnail_name
+
+
+class Command(BaseCommand):
+    help = 'Готовит недостающие варианты картинок постов в пуле процессов'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='Число процессов; по умолчанию THUMBNAIL_WORKERS')
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перерезать варианты и у постов, где они уже есть')
+
+    def handle(self, *args, **options):
+        posts = [
+            post for post in Post.objects.exclude(image='').only(
+                'pk', 'image', 'thumbnail').iterator()
+            if options['force']
+            or post.thumbnail != thumbnail_name(post.image.name)
+        ]
+        failed = generate_thumbnails(posts, options['workers'])
+        for post, error in failed:
+            self.stderr.write(f'Пост {post.pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Картинок подготовлено: {len(posts) - len(failed)}, '
+            f'с ошибкой: {len(failed)}'))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from posts.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает счётчики постов, комментариев, подписчиков '
+            'и подписок')
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            rebuild_counters()
+        self.stdout.write(self.style.SUCCESS('Счётчики пересчитаны'))
@@ -0,0 +1,59 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from posts.models import Post
+from posts.seeding import CHUNK_SIZE, IMAGE_DIR, Seeder
+from posts.thumbnails import generate_thumbnails
+
+
+class Command(BaseCommand):
+    help = ('Наполняет базу синтетическими пользователями, группами, '
+            'постами, комментариями и подписками')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=1000)
+        parser.add_argument('--groups', type=int, default=20)
+        parser.add_argument('--posts', type=int, default=10000)
+        parser.add_argument('--comments', type=int, default=20000)
+        parser.add_argument('--follows', type=int, default=10000)
+        parser.add_argument(
+            '--images', type=int, default=0,
+            help='Сколько постов снабдить картинками')
+        parser.add_argument(
+            '--seed', type=int, default=0,
+            help='Зерно генератора: одинаковое зерно - одинаковые данные')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+        parser.add_argument(
+            '--workers', type=int, default=2,
+            help='Процессов для картинок; 0 - рисовать в этом процессе')
+        parser.add_argument('--locale', default='ru_RU')
+
+    def handle(self, *args, **options):
+        seeder = Seeder(
+            seed=options['seed'],
+            chunk_size=options['chunk_size'],
+            locale=options['locale'],
+            workers=options['workers'],
+        )
+        started = time.perf_counter()
+        created = seeder.run(
+            users=options['users'],
+            groups=options['groups'],
+            posts=options['posts'],
+            comments=options['comments'],
+            follows=options['follows'],
+            images=options['images'],
+        )
+        if created['posts'] and options['images']:
+            # Варианты картинок сигналы бы нарезали сами, здесь - пакетом.
+            posts = Post.objects.filter(
+                image__startswith=IMAGE_DIR, thumbnail='',
+            ).only('pk', 'image', 'thumbnail')
+            for post, error in generate_thumbnails(
+                    posts.iterator(), options['workers']):
+                self.stderr.write(f'Пост {post.pk}: {error}')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано за {time.perf_counter() - started:.1f} с: '
+            + ', '.join(f'{model} {count}'
+                        for model, count in created.items())))
@@ -0,0 +1,37 @@
+# Generated by Django 2.2.16 on 2026-10-18 07:17
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled(apps, schema_editor):
+    # Посты авторов, у которых подписчиков не меньше порога, до сих пор
+    # не раскладывались по лентам - теперь это помнит флаг.
+    UserStats = apps.get_model('posts', 'UserStats')
+    UserStats.objects.filter(
+        followers_count__gte=settings.TIMELINE_FANOUT_LIMIT
+    ).update(timeline_pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('posts', '0016_post_feed_indexes'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='timelineentry',
+            name='timeline_user_date_idx',
+        ),
+        migrations.AddField(
+            model_name='userstats',
+            name='timeline_pulled',
+            field=models.BooleanField(default=False, verbose_name='Лента читается при показе'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-post'], name='timeline_user_key_idx'),
+        ),
+        migrations.RunPython(mark_pulled, migrations.RunPython.noop),
+    ]
@@ -1,10 +1,26 @@
 from core.models import CreatedModel
+from django.core.files.storage import default_storage
 from django.db import models
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
 
+class PostQuerySet(models.QuerySet):
+    def for_feed(self):
+        """Посты для лент: только выводимые в шаблонах поля, без N+1.
+
+        Количество комментариев берётся из денормализованного
+        `comments_count`, поэтому агрегировать его не нужно.
+        """
+        return self.select_related('author', 'group').only(
+            'id', 'text', 'pub_date', 'image', 'thumbnail', 'image_variants',
+            'comments_count',
+            'author__username', 'author__first_name', 'author__last_name',
+            'group__slug', 'group__title',
+        )
+
+
 class Post(CreatedModel):
     text = models.TextField(
         verbose_name='Текст поста',
@@ -27,12 +43,49 @@ class Post(CreatedModel):
         upload_to='posts/',
         blank=True
     )
+    thumbnail = models.CharField(
+        'Миниатюра',
+        max_length=255,
+        blank=True,
+        editable=False
+    )
+    image_variants = models.CharField(
+        'Варианты картинки',
+        max_length=100,
+        blank=True,
+        editable=False
+    )
+    comments_count = models.PositiveIntegerField(
+        'Количество комментариев',
+        default=0,
+        editable=False
+    )
+
+    objects = PostQuerySet.as_manager()
 
     def __str__(self):
         return self.text[:15]
 
+    @property
+    def thumbnail_url(self):
+        if self.thumbnail:
+            return default_storage.url(self.thumbnail)
+        if self.image:
+            return self.image.url
+        return ''
+
     class Meta:
         ordering = ["-pub_date"]
+        # Ленты автора и группы: фильтр и сортировка ключом курсора
+        # (pub_date, id) читаются из одного индекса, без сортировки.
+        indexes = [
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='post_author_date_idx'),
+            models.Index(
+                fields=['group', '-pub_date', '-id'],
+                name='post_group_date_idx'),
+        ]
 
 
 class Group(models.Model):
@@ -72,6 +125,12 @@ class Comment(CreatedModel):
         verbose_name='Текст комментария',
         help_text='Введите текст Вашего комментария')
 
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['post', 'pub_date'], name='comment_post_date_idx'),
+        ]
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -84,3 +143,62 @@ class Follow(models.Model):
         on_delete=models.CASCADE,
         related_name='following'
     )
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'author'], name='unique_follow'),
+        ]
+
+
+class UserStats(models.Model):
+    """Денормализованные счётчики пользователя.
+
+    Поддерживаются обработчиками сигналов `Post` и `Follow`,
+    пересобираются командой `rebuild_counters`.
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        primary_key=True,
+        related_name='stats'
+    )
+    posts_count = models.PositiveIntegerField('Количество постов', default=0)
+    followers_count = models.PositiveIntegerField(
+        'Количество подписчиков', default=0)
+    following_count = models.PositiveIntegerField(
+        'Количество подписок', default=0)
+    # Посты автора не раскладываются по лентам, а читаются при показе.
+    # Флаг не снимается, когда подписчиков становится меньше: иначе
+    # посты, которые не были разложены, пропали бы из лент.
+    timeline_pulled = models.BooleanField(
+        'Лента читается при показе', default=False)
+
+    def __str__(self):
+        return f'Счётчики {self.user}'
+
+
+class TimelineEntry(models.Model):
+    """Запись материализованной ленты подписок пользователя."""
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    post = models.ForeignKey(
+        Post,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries'
+    )
+    pub_date = models.DateTimeField('Дата создания поста')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'post'], name='unique_timeline_entry'),
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-post'],
+                name='timeline_user_key_idx'),
+        ]
@@ -0,0 +1,196 @@
+import math
+import re
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+
+from .models import Post
+from .utils import CursorPaginator, is_db_int
+
+MARK_START = '\x02'
+MARK_END = '\x03'
+
+
+def format_snippet(snippet):
+    """Экранирует фрагмент и подсвечивает найденные слова тегом <mark>."""
+    return mark_safe(
+        escape(snippet)
+        .replace(MARK_START, '<mark>')
+        .replace(MARK_END, '</mark>')
+    )
+
+
+def search_terms(query):
+    return re.findall(r'\w+', query.lower())
+
+
+class BaseSearchBackend:
+    """Интерфейс полнотекстового индекса постов.
+
+    `search()` возвращает не больше `limit` найденных записей
+    `(post_id, rank, snippet)` по возрастанию пары `(rank, post_id)`,
+    начиная за ключом `key` (или до него при `forward=False`).
+    """
+
+    def index(self, post):
+        raise NotImplementedError
+
+    def remove(self, post_id):
+        raise NotImplementedError
+
+    def rebuild(self):
+        raise NotImplementedError
+
+    def search(self, query, limit, key=None, forward=True):
+        raise NotImplementedError
+
+    def filter_queryset(self, queryset, query):
+        """Сужает QuerySet постов до найденных по запросу."""
+        raise NotImplementedError
+
+
+class SimpleSearchBackend(BaseSearchBackend):
+    """Поиск через LIKE для баз без полнотекстового индекса."""
+
+    def index(self, post):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def rebuild(self):
+        pass
+
+    def filter_queryset(self, queryset, query):
+        for term in search_terms(query):
+            queryset = queryset.filter(text__icontains=term)
+        return queryset
+
+    def search(self, query, limit, key=None, forward=True):
+        # Ранга нет: самые новые посты идут первыми, ранг равен -id.
+        queryset = self.filter_queryset(Post.objects.all(), query)
+        if key is not None:
+            lookup = 'pk__lt' if forward else 'pk__gt'
+            queryset = queryset.filter(**{lookup: key[1]})
+        queryset = queryset.order_by('-pk' if forward else 'pk')
+        return [
+            (pk, -pk, format_snippet(Truncator(text).words(30)))
+            for pk, text in queryset.values_list('pk', 'text')[:limit]
+        ]
+
+
+class SQLiteSearchBackend(BaseSearchBackend):
+    """Инвертированный индекс на виртуальной таблице SQLite FTS5.
+
+    Ранжирование - встроенный bm25 (`rank`), фрагменты - `snippet()`.
+    """
+
+    table = 'posts_post_fts'
+    snippet_tokens = 24
+
+    def _match(self, query):
+        # Каждое слово - отдельная фраза в кавычках: синтаксис FTS5
+        # из пользовательского ввода не интерпретируется.
+        return ' '.join(f'"{term}"' for term in search_terms(query))
+
+    def index(self, post):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [post.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, text) VALUES (%s, %s)',
+                [post.pk, post.text])
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def rebuild(self):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, text) '
+                f'SELECT id, text FROM {Post._meta.db_table}')
+
+    def filter_queryset(self, queryset, query):
+        match = self._match(query)
+        if not match:
+            return queryset
+        return queryset.extra(
+            where=[f'{Post._meta.db_table}.id IN (SELECT rowid FROM '
+                   f'{self.table} WHERE {self.table} MATCH %s)'],
+            params=[match],
+        )
+
+    def search(self, query, limit, key=None, forward=True):
+        match = self._match(query)
+        if not match:
+            return []
+        where = f'{self.table} MATCH %s'
+        params = [MARK_START, MARK_END, match]
+        compare, direction = ('>', 'ASC') if forward else ('<', 'DESC')
+        if key is not None:
+            where += (f' AND (rank {compare} %s'
+                      f' OR (rank = %s AND rowid {compare} %s))')
+            params += [key[0], key[0], key[1]]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"SELECT rowid, rank, snippet({self.table}, 0, %s, %s, '…', "
+                f'{self.snippet_tokens}) FROM {self.table} WHERE {where} '
+                f'ORDER BY rank {direction}, rowid {direction} LIMIT %s',
+                params + [limit])
+            return [
+                (pk, rank, format_snippet(snippet))
+                for pk, rank, snippet in cursor.fetchall()
+            ]
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+class SearchPaginator(CursorPaginator):
+    """Курсорная пагинация результатов поиска по ключу (rank, id)."""
+
+    def __init__(self, query, per_page, backend=None):
+        self.query = query
+        self.backend = backend or get_search_backend()
+        Paginator.__init__(self, [], per_page)
+
+    def key_for(self, obj):
+        return obj.search_rank, obj.pk
+
+    def fetch(self, limit, values=None, forward=True):
+        if values is not None:
+            if (len(values) != 2
+                    or not isinstance(values[0], (int, float))
+                    or not math.isfinite(values[0])
+                    or not is_db_int(values[1])):
+                return None
+        hits = self.backend.search(self.query, limit, values, forward)
+        posts = Post.objects.for_feed().in_bulk([pk for pk, _, _ in hits])
+        items = []
+        for pk, rank, snippet in hits:
+            post = posts.get(pk)
+            if post is None:
+                continue
+            post.search_rank = rank
+            post.snippet = snippet
+            items.append(post)
+        return items
+
+
+def search_paginator(request, query):
+    paginator = SearchPaginator(query, settings.POSTS_PER_PAGE)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+    )
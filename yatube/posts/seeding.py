@@ -0,0 +1,240 @@
+"""Быстрое наполнение базы синтетическими постами для стендов и бенчмарков.
+
+Строки вставляются пачками `bulk_create` в обход сигналов, поэтому после
+наполнения счётчики, ленты подписок и поисковый индекс пересобираются
+целиком. Число постов у авторов и подписчиков у них распределено по
+степенному закону: немного популярных авторов и длинный хвост.
+
+Объекты генерируются потоком и не копятся в памяти: в каждый момент
+собрана только одна пачка. Картинки постов рисуются в пуле процессов
+параллельно со вставкой строк.
+"""
+import itertools
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+from datetime import timedelta
+
+from django.contrib.auth import get_user_model
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from django.utils import timezone
+from faker import Faker
+from PIL import Image, ImageOps
+
+from .counters import rebuild_counters
+from .models import Comment, Follow, Group, Post
+from .search import get_search_backend
+from .timeline import get_timeline_backend
+
+User = get_user_model()
+
+CHUNK_SIZE = 2000
+# Посты и комментарии равномерно разбросаны по последнему году.
+DATE_SPREAD = timedelta(days=365)
+IMAGE_SIZE = (1280, 720)
+IMAGE_DIR = 'posts/seed'
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(itertools.islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def power_law_weights(count, alpha):
+    """Накопленные веса закона Ципфа для `random.choices`."""
+    return list(itertools.accumulate(
+        1 / (rank ** alpha) for rank in range(1, count + 1)))
+
+
+def render_image(path, seed, size=IMAGE_SIZE):
+    """Рисует картинку-заглушку с градиентом; выполняется в пуле процессов."""
+    rng = random.Random(seed)
+    gradient = Image.linear_gradient('L').rotate(rng.randrange(360))
+    image = ImageOps.colorize(
+        gradient.resize(size),
+        tuple(rng.randrange(256) for _ in range(3)),
+        tuple(rng.randrange(256) for _ in range(3)),
+    )
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    image.save(path, 'JPEG', quality=80)
+
+
+@contextmanager
+def keep_dates(*models):
+    """Отключает `auto_now_add` у `pub_date`, чтобы задать даты вручную."""
+    fields = [model._meta.get_field('pub_date') for model in models]
+    for field in fields:
+        field.auto_now_add = False
+    try:
+        yield
+    finally:
+        for field in fields:
+            field.auto_now_add = True
+
+
+class Seeder:
+    """Генератор синтетических данных с воспроизводимым `seed`."""
+
+    def __init__(self, seed=0, chunk_size=CHUNK_SIZE, alpha=1.1,
+                 locale='ru_RU', workers=0):
+        self.seed = seed
+        self.random = random.Random(seed)
+        self.faker = Faker(locale)
+        self.faker.seed_instance(seed)
+        self.chunk_size = chunk_size
+        self.alpha = alpha
+        self.workers = workers
+        self.now = timezone.now()
+
+    def _insert(self, model, objects):
+        """Вставляет объекты пачками и возвращает id новых строк."""
+        last = model.objects.order_by('-pk').values_list(
+            'pk', flat=True).first() or 0
+        for chunk in chunked(objects, self.chunk_size):
+            with transaction.atomic():
+                model.objects.bulk_create(chunk)
+        return list(model.objects.filter(pk__gt=last).order_by(
+            'pk').values_list('pk', flat=True))
+
+    def _date(self):
+        return self.now - DATE_SPREAD * self.random.random()
+
+    def _popular(self, ids, count):
+        """Поток из `count` случайных id; первые в списке - популярнее."""
+        weights = power_law_weights(len(ids), self.alpha)
+        while count > 0:
+            size = min(count, self.chunk_size)
+            yield from self.random.choices(ids, cum_weights=weights, k=size)
+            count -= size
+
+    def users(self, count):
+        offset = User.objects.count()
+        return self._insert(User, (
+            User(username=f'{self.faker.user_name()}_{offset + number}',
+                 first_name=self.faker.first_name(),
+                 last_name=self.faker.last_name(),
+                 password='!')
+            for number in range(count)
+        ))
+
+    def groups(self, count):
+        offset = Group.objects.count()
+        return self._insert(Group, (
+            Group(title=self.faker.catch_phrase()[:200],
+                  slug=f'group-{offset + number}',
+                  description=self.faker.paragraph())
+            for number in range(count)
+        ))
+
+    def _images(self, count, images):
+        """Имена картинок для `count` постов: ровно `images` непустых.
+
+        Картинки рисуются в фоне; возвращает поток имён и список задач.
+        """
+        offset = Post.objects.count()
+        executor = (ProcessPoolExecutor(max_workers=self.workers)
+                    if images and self.workers else None)
+        futures = []
+
+        def generate():
+            for number in range(count):
+                if (number + 1) * images // count == number * images // count:
+                    yield ''
+                    continue
+                name = f'{IMAGE_DIR}/{offset + number}.jpg'
+                args = (default_storage.path(name), self.seed + number)
+                if executor is None:
+                    render_image(*args)
+                else:
+                    futures.append(executor.submit(render_image, *args))
+                yield name
+
+        return generate(), executor, futures
+
+    def posts(self, count, user_ids, group_ids, images=0):
+        authors = self._popular(user_ids, count)
+        image_names, executor, futures = self._images(count, images)
+        try:
+            with keep_dates(Post):
+                post_ids = self._insert(Post, (
+                    Post(author_id=author_id,
+                         group_id=(self.random.choice(group_ids)
+                                   if group_ids and self.random.random() < 0.7
+                                   else None),
+                         text=self.faker.paragraph(nb_sentences=4),
+                         image=image_name,
+                         pub_date=self._date())
+                    for author_id, image_name in zip(authors, image_names)
+                ))
+            for future in futures:
+                future.result()
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return post_ids
+
+    def comments(self, count, post_ids, user_ids):
+        posts = self._popular(post_ids, count)
+        with keep_dates(Comment):
+            return self._insert(Comment, (
+                Comment(post_id=post_id,
+                        author_id=self.random.choice(user_ids),
+                        text=self.faker.sentence(),
+                        pub_date=self._date())
+                for post_id in posts
+            ))
+
+    def follows(self, count, user_ids):
+        count = min(count, len(user_ids) * (len(user_ids) - 1))
+        pairs = set(Follow.objects.values_list('user_id', 'author_id'))
+        start = len(pairs)
+
+        def generate():
+            while len(pairs) - start < count:
+                for author_id in self._popular(
+                        user_ids, count - len(pairs) + start):
+                    pair = (self.random.choice(user_ids), author_id)
+                    if pair[0] == author_id or pair in pairs:
+                        continue
+                    pairs.add(pair)
+                    yield Follow(user_id=pair[0], author_id=author_id)
+                    if len(pairs) - start == count:
+                        return
+
+        return self._insert(Follow, generate())
+
+    def finish(self):
+        """Пересобирает то, что обычно поддерживают сигналы."""
+        with transaction.atomic():
+            rebuild_counters()
+            get_search_backend().rebuild()
+            get_timeline_backend().rebuild_all(
+                User.objects.filter(follower__isnull=False).distinct())
+        # Статистика таблиц нужна планировщику и примерным счётчикам.
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def run(self, users=0, groups=0, posts=0, comments=0, follows=0,
+            images=0):
+        """Наполняет базу и возвращает число созданных строк по моделям."""
+        user_ids = self.users(users)
+        group_ids = self.groups(groups)
+        post_ids = (self.posts(posts, user_ids, group_ids, min(images, posts))
+                    if user_ids else [])
+        comment_ids = (self.comments(comments, post_ids, user_ids)
+                       if post_ids else [])
+        follow_ids = self.follows(follows, user_ids) if user_ids else []
+        self.finish()
+        return {
+            'users': len(user_ids),
+            'groups': len(group_ids),
+            'posts': len(post_ids),
+            'comments': len(comment_ids),
+            'follows': len(follow_ids),
+        }
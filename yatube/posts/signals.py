@@ -0,0 +1,160 @@
+import threading
+
+from django.db.models.signals import (post_delete, post_init, post_save,
+                                      pre_delete)
+from django.dispatch import receiver
+
+from .cache import bump_feed_generation, post_page_scopes, purge_pages
+from .counters import bump_comments_count, bump_user_stats
+from .follows import drop_follow_set
+from .lookups import author_cache, group_cache, post_cache
+from .models import Comment, Follow, Group, Post, User, UserStats
+from .search import get_search_backend
+from .thumbnails import schedule_thumbnail
+from .timeline import get_timeline_backend
+
+# Посты, которые удаляются в этом потоке: их комментарии уходят каскадом,
+# и сбрасывать кэши и счётчики для каждого из них незачем.
+_deleting = threading.local()
+
+
+def _deleting_posts():
+    if not hasattr(_deleting, 'posts'):
+        _deleting.posts = set()
+    return _deleting.posts
+
+
+# Поля пользователя, видимые на страницах и в кэше объектов.
+USER_IDENTITY = ('username', 'first_name', 'last_name')
+
+
+def _user_identity(user):
+    # Через __dict__, чтобы не загружать отложенные поля.
+    return tuple(user.__dict__.get(field) for field in USER_IDENTITY)
+
+
+@receiver(post_init, sender=User)
+def user_loaded(sender, instance, **kwargs):
+    instance._loaded_identity = _user_identity(instance)
+
+
+@receiver(post_save, sender=User)
+def user_saved(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        UserStats.objects.get_or_create(user=instance)
+    identity = _user_identity(instance)
+    # Вход пользователя сохраняет только last_login - сбрасывать нечего.
+    if not created and identity == instance._loaded_identity:
+        return
+    usernames = {instance.username, instance._loaded_identity[0]} - {None}
+    instance._loaded_identity = identity
+    for username in usernames:
+        # У нового пользователя это закэшированный промах.
+        author_cache.invalidate_key(username)
+    if not created:
+        _author_renamed(instance, usernames)
+
+
+def _author_renamed(user, usernames):
+    # Имя автора выводится рядом с каждым его постом: в кэше объектов,
+    # во фрагментах лент и на страницах ленты, групп и постов.
+    post_cache.invalidate()
+    bump_feed_generation()
+    posts = Post.objects.filter(author=user).values_list('pk', 'group__slug')
+    scopes = {'index', *(f'profile:{username}' for username in usernames)}
+    for post_id, slug in posts:
+        scopes.add(f'post:{post_id}')
+        if slug is not None:
+            scopes.add(f'group:{slug}')
+    purge_pages(*scopes)
+
+
+@receiver(post_delete, sender=User)
+def user_deleted(sender, instance, **kwargs):
+    author_cache.invalidate_key(instance.username)
+
+
+@receiver(post_init, sender=Post)
+def post_loaded(sender, instance, **kwargs):
+    # Исходная группа нужна, чтобы при переносе поста сбросить и её
+    # страницы. Через __dict__, чтобы не загружать отложенное поле.
+    instance._loaded_group_id = instance.__dict__.get('group_id')
+
+
+@receiver(post_save, sender=Post)
+def post_created(sender, instance, created, raw=False, **kwargs):
+    bump_feed_generation()
+    post_cache.invalidate_key(instance.pk)
+    purge_pages(*post_page_scopes(
+        instance, group_ids=[instance._loaded_group_id]))
+    instance._loaded_group_id = instance.group_id
+    get_search_backend().index(instance)
+    if not raw:
+        schedule_thumbnail(instance)
+    if created and not raw:
+        bump_user_stats(instance.author_id, posts_count=1)
+        get_timeline_backend().add_post(instance)
+
+
+@receiver(pre_delete, sender=Post)
+def post_deleting(sender, instance, **kwargs):
+    _deleting_posts().add(instance.pk)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted(sender, instance, **kwargs):
+    _deleting_posts().discard(instance.pk)
+    bump_feed_generation()
+    post_cache.invalidate_key(instance.pk)
+    purge_pages(*post_page_scopes(instance))
+    get_search_backend().remove(instance.pk)
+    bump_user_stats(instance.author_id, create=False, posts_count=-1)
+
+
+@receiver(post_save, sender=Comment)
+def comment_created(sender, instance, created, raw=False, **kwargs):
+    bump_feed_generation()
+    purge_pages(*post_page_scopes(instance.post))
+    if created and not raw:
+        bump_comments_count(instance.post_id, 1)
+
+
+@receiver(post_delete, sender=Comment)
+def comment_deleted(sender, instance, **kwargs):
+    if instance.post_id in _deleting_posts():
+        return
+    bump_feed_generation()
+    purge_pages(*post_page_scopes(instance.post))
+    bump_comments_count(instance.post_id, -1)
+
+
+@receiver(post_save, sender=Follow)
+def follow_created(sender, instance, created, raw=False, **kwargs):
+    bump_feed_generation()
+    purge_pages(f'profile:{instance.user.username}',
+                f'profile:{instance.author.username}')
+    if created and not raw:
+        bump_user_stats(instance.user_id, following_count=1)
+        bump_user_stats(instance.author_id, followers_count=1)
+        get_timeline_backend().follow(instance.user_id, instance.author_id)
+        drop_follow_set(instance.user_id)
+
+
+@receiver(post_delete, sender=Follow)
+def follow_deleted(sender, instance, **kwargs):
+    bump_feed_generation()
+    purge_pages(f'profile:{instance.user.username}',
+                f'profile:{instance.author.username}')
+    bump_user_stats(instance.user_id, create=False, following_count=-1)
+    bump_user_stats(instance.author_id, create=False, followers_count=-1)
+    get_timeline_backend().unfollow(instance.user_id, instance.author_id)
+    drop_follow_set(instance.user_id)
+
+
+@receiver(post_save, sender=Group)
+@receiver(post_delete, sender=Group)
+def group_changed(sender, instance, **kwargs):
+    bump_feed_generation()
+    group_cache.invalidate()
+    post_cache.invalidate()
+    purge_pages('index', f'group:{instance.slug}')
@@ -0,0 +1,11 @@
+from django import template
+
+from posts.follows import is_following as user_is_following
+
+register = template.Library()
+
+
+@register.filter
+def is_following(user, author):
+    """`{% if user|is_following:post.author %}` без запроса на каждого."""
+    return user_is_following(user, getattr(author, 'pk', author))
@@ -0,0 +1,47 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from posts.thumbnails import parse_variants, thumbnail_name, variant_name
+
+register = template.Library()
+
+# Лента и страница поста выводят картинку на всю ширину колонки.
+DEFAULT_SIZES = '(max-width: 960px) 100vw, 960px'
+
+
+def _srcset(image_name, widths, image_format):
+    return ', '.join(
+        f'{default_storage.url(variant_name(image_name, width, image_format))}'
+        f' {width}w'
+        for width in widths
+    )
+
+
+@register.simple_tag
+def post_picture(post, css_class='card-img my-2', sizes=DEFAULT_SIZES):
+    """`<picture>` с вариантами картинки поста по ширинам и форматам.
+
+    Пока варианты для текущей картинки не нарезаны, отдаёт исходную.
+    """
+    if not post.image:
+        return ''
+    formats, widths = parse_variants(post.image_variants)
+    if (post.thumbnail != thumbnail_name(post.image.name)
+            or 'jpeg' not in formats):
+        return format_html(
+            '<img class="{}" src="{}" alt="">', css_class, post.image.url)
+    image_name = post.image.name
+    sources = format_html_join(
+        '', '<source type="image/{}" srcset="{}" sizes="{}">',
+        (
+            (image_format, _srcset(image_name, widths, image_format), sizes)
+            for image_format in formats if image_format != 'jpeg'
+        ),
+    )
+    return format_html(
+        '<picture>{}<img class="{}" src="{}" srcset="{}" sizes="{}" '
+        'alt="" loading="lazy"></picture>',
+        sources, css_class, default_storage.url(post.thumbnail),
+        _srcset(image_name, widths, 'jpeg'), sizes,
+    )
@@ -1,8 +1,12 @@
 import shutil
 import tempfile
 
+from io import StringIO
+
 from posts.forms import PostForm
 from posts.models import Post, Group, Comment, User
+from posts.thumbnails import parse_variants, thumbnail_name
+from django.core.management import call_command
 from django.test import Client, TestCase, override_settings
 from django.urls import reverse
 from django.conf import settings
@@ -35,6 +39,14 @@ class PostsFormTests(TestCase):
             group=cls.group
         )
         cls.form = PostForm()
+        cls.small_image = (
+            b'\x47\x49\x46\x38\x39\x61\x02\x00'
+            b'\x01\x00\x80\x00\x00\x00\x00\x00'
+            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
+            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
+            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
+            b'\x0A\x00\x3B'
+        )
 
     @classmethod
     def tearDownClass(cls):
@@ -54,17 +66,9 @@ class PostsFormTests(TestCase):
         # Подсчитаем количество записей в Post
         posts_count = Post.objects.count()
         input_textfield_form_create = 'Тестовый текст, созданный через форму'
-        small_image = (
-            b'\x47\x49\x46\x38\x39\x61\x02\x00'
-            b'\x01\x00\x80\x00\x00\x00\x00\x00'
-            b'\xFF\xFF\xFF\x21\xF9\x04\x00\x00'
-            b'\x00\x00\x00\x2C\x00\x00\x00\x00'
-            b'\x02\x00\x01\x00\x00\x02\x02\x0C'
-            b'\x0A\x00\x3B'
-        )
         uploaded = SimpleUploadedFile(
             name='small.gif',
-            content=small_image,
+            content=self.small_image,
             content_type='image/gif'
         )
         form_data = {
@@ -94,6 +98,54 @@ class PostsFormTests(TestCase):
             ).exists()
         )
 
+    def test_thumbnail_pregeneration(self):
+        """- Проверка подготовки вариантов картинки вне запроса"""
+        post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='thumb.gif', content=self.small_image,
+                content_type='image/gif')
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        # Пост без вариантов попадает в кэш объектов.
+        self.authorized_client.get(url)
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        post.refresh_from_db()
+        self.assertEqual(post.thumbnail, thumbnail_name(post.image.name))
+        formats, widths = parse_variants(post.image_variants)
+        self.assertIn('jpeg', formats)
+        self.assertIn(settings.POST_THUMBNAIL_SIZE[0], widths)
+        response = self.authorized_client.get(url)
+        self.assertContains(response, f'src="{post.thumbnail_url}"')
+        self.assertContains(
+            response, f'{post.thumbnail_url} {widths[-1]}w')
+        self.assertTrue(post.thumbnail_url.startswith(settings.MEDIA_URL))
+
+    def test_replaced_image_drops_variants(self):
+        """- Проверка, что варианты прежней картинки не выводятся"""
+        post = Post.objects.create(
+            text='Пост с картинкой',
+            author=self.user,
+            image=SimpleUploadedFile(
+                name='old.gif', content=self.small_image,
+                content_type='image/gif')
+        )
+        call_command('generate_thumbnails', workers=1, stdout=StringIO())
+        post.refresh_from_db()
+        old_thumbnail_url = post.thumbnail_url
+        post.image = SimpleUploadedFile(
+            name='new.gif', content=self.small_image,
+            content_type='image/gif')
+        post.save()
+        post.refresh_from_db()
+        self.assertEqual((post.thumbnail, post.image_variants), ('', ''))
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, f'src="{post.image.url}"')
+        self.assertNotContains(response, old_thumbnail_url)
+        self.assertNotContains(response, 'srcset')
+
     def test_edit_post(self):
         """- Проверка формы редактирования поста"""
         # Подсчитаем количество записей в Post
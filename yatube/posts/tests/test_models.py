@@ -1,7 +1,18 @@
+import shutil
+import tempfile
+from io import StringIO
+
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.management import call_command
+from django.db import connection, models
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 
-from ..models import Group, Post
+from ..models import Comment, Follow, Group, Post, TimelineEntry, UserStats
+from ..management.commands.benchmark import compare, percentile, summarize
+from ..management.commands.explain_views import plan_warnings
+from ..seeding import Seeder
 
 User = get_user_model()
 
@@ -70,3 +81,143 @@ class PostModelTest(TestCase):
         }
         PostModelTest.subtest_list_assertequal(
             self, expected_group_verbose_names)
+
+
+class CountersTest(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(username='author')
+        cls.reader = User.objects.create_user(username='reader')
+
+    def test_counters_follow_signals(self):
+        """- Проверка счётчиков, поддерживаемых сигналами"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        comment = Comment.objects.create(
+            post=post, author=self.reader, text='Комментарий')
+        follow = Follow.objects.create(user=self.reader, author=self.author)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 1)
+        author_stats = UserStats.objects.get(user=self.author)
+        self.assertEqual(author_stats.posts_count, 1)
+        self.assertEqual(author_stats.followers_count, 1)
+        self.assertEqual(
+            UserStats.objects.get(user=self.reader).following_count, 1)
+        comment.delete()
+        follow.delete()
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 0)
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).followers_count, 0)
+
+    def test_post_delete_skips_cascaded_comments(self):
+        """- Проверка, что удаление поста не обходит его комментарии"""
+        post = Post.objects.create(author=self.author, text='Пост')
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.reader, text='Комментарий')
+            for _ in range(50))
+        with CaptureQueriesContext(connection) as queries:
+            post.delete()
+        self.assertLess(len(queries), 20)
+        self.assertFalse(Comment.objects.exists())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 0)
+
+    def test_rebuild_counters_command(self):
+        """- Проверка пересборки счётчиков командой rebuild_counters"""
+        Post.objects.bulk_create(
+            Post(author=self.author, text=f'Пост {i}') for i in range(3))
+        post = Post.objects.first()
+        Comment.objects.bulk_create(
+            Comment(post=post, author=self.reader, text='Комментарий')
+            for _ in range(2))
+        UserStats.objects.all().delete()
+        call_command('rebuild_counters', stdout=StringIO())
+        self.assertEqual(
+            UserStats.objects.get(user=self.author).posts_count, 3)
+        post.refresh_from_db()
+        self.assertEqual(post.comments_count, 2)
+
+
+class SeedingTest(TestCase):
+    def test_seeder_fills_database(self):
+        """- Проверка наполнения базы синтетическими данными"""
+        created = Seeder(seed=1, chunk_size=7).run(
+            users=10, groups=2, posts=30, comments=20, follows=15)
+        self.assertEqual(created, {
+            'users': 10, 'groups': 2, 'posts': 30,
+            'comments': 20, 'follows': 15,
+        })
+        self.assertEqual(
+            sum(UserStats.objects.values_list('posts_count', flat=True)), 30)
+        self.assertFalse(Follow.objects.filter(
+            user=models.F('author')).exists())
+        expected = Post.objects.filter(
+            author__following__isnull=False).count()
+        self.assertEqual(TimelineEntry.objects.count(), expected)
+        dates = set(Post.objects.values_list('pub_date', flat=True))
+        self.assertEqual(len(dates), 30)
+
+    def test_seed_command_with_images(self):
+        """- Проверка команды seed с картинками"""
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        with override_settings(MEDIA_ROOT=media_root):
+            call_command(
+                'seed', users=5, groups=1, posts=10, comments=5, follows=5,
+                images=2, workers=0, seed=2, stdout=StringIO())
+            posts = Post.objects.exclude(image='')
+            self.assertEqual(posts.count(), 2)
+            for post in posts:
+                self.assertTrue(default_storage.exists(post.image.name))
+                self.assertTrue(default_storage.exists(post.thumbnail))
+
+
+class BenchmarkTest(TestCase):
+    def test_percentile_and_summary(self):
+        """- Проверка перцентилей и сводки замеров"""
+        durations = [i / 1000 for i in range(100, 0, -1)]
+        self.assertEqual(percentile(durations, 50), 0.05)
+        self.assertEqual(percentile(durations, 95), 0.095)
+        self.assertEqual(percentile([0.2], 99), 0.2)
+        self.assertEqual(summarize(durations, [3, 5, 4]), {
+            'p50_ms': 50.0, 'p95_ms': 95.0, 'p99_ms': 99.0,
+            'mean_ms': 50.5, 'queries': 5,
+        })
+
+    def test_compare_with_baseline(self):
+        """- Проверка сравнения с базовым прогоном и допуска"""
+        baseline = {'index/cold': {'p95_ms': 10.0, 'queries': 3}}
+        within = {'index/cold': {'p95_ms': 11.9, 'queries': 3},
+                  'new/cold': {'p95_ms': 100.0, 'queries': 9}}
+        self.assertEqual(compare(within, baseline, 0.2), [])
+        slower = {'index/cold': {'p95_ms': 12.1, 'queries': 4}}
+        self.assertEqual(compare(slower, baseline, 0.2), [
+            'index/cold: p95 10.0 -> 12.1 мс',
+            'index/cold: запросов 3 -> 4',
+        ])
+        self.assertEqual(len(compare(slower, baseline, 0.25)), 1)
+
+
+class ExplainViewsTest(TestCase):
+    def test_plan_warnings(self):
+        """- Проверка разбора планов запросов"""
+        self.assertEqual(plan_warnings([
+            'SCAN posts_post',
+            'SEARCH posts_post USING INDEX post_group_date_idx (group_id=?)',
+            'USE TEMP B-TREE FOR ORDER BY',
+        ]), ['полный проход', 'сортировка во временном B-дереве'])
+        self.assertEqual(plan_warnings([
+            'SCAN posts_post USING INDEX posts_post_pub_date_131c7f8d',
+            'SCAN CONSTANT ROW',
+        ]), [])
+
+    def test_explain_views_uses_feed_indexes(self):
+        """- Проверка, что ленты читаются по составным индексам"""
+        Seeder(seed=3).run(
+            users=20, groups=2, posts=200, comments=50, follows=30)
+        out = StringIO()
+        call_command('explain_views', stdout=out)
+        output = out.getvalue()
+        for index in ('post_author_date_idx', 'post_group_date_idx',
+                      'comment_post_date_idx'):
+            self.assertIn(index, output)
@@ -1,4 +1,5 @@
 # posts/tests/test_urls.py
+from django.core.cache import caches
 from django.test import TestCase, Client
 from posts.models import Post, Group, User
 from http import HTTPStatus
@@ -23,6 +24,8 @@ class PostsURLTests(TestCase):
         )
 
     def setUp(self):
+        # Откат базы между тестами не сбрасывает кэш страниц
+        caches['pages'].clear()
         # Создаем неавторизованный клиент
         self.guest_client = Client()
         # Создаем второй клиент
@@ -1,7 +1,17 @@
-from django.test import Client, TestCase
+import time
+from unittest import mock
+
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.test import Client, TestCase, TransactionTestCase
 from django.urls import reverse
-from posts.models import Post, Group, Follow, User
+from posts.models import Comment, Post, Group, Follow, TimelineEntry, User
+from posts import follows
+from posts.cache import _scope_key
 from posts.forms import PostForm
+from posts.lookups import post_cache
+from posts.timeline import DatabaseTimelineBackend, TimelinePaginator
+from posts.utils import encode_cursor, page_window
 from django.conf import settings
 
 
@@ -23,6 +33,8 @@ class PostsPagesTests(TestCase):
         )
 
     def setUp(self):
+        # Откат базы между тестами не сбрасывает кэш страниц
+        caches['pages'].clear()
         # Создаем неавторизованный клиент
         self.guest_client = Client()
         # Создаем второй клиент
@@ -107,6 +119,27 @@ class PostsPagesTests(TestCase):
                     'post_id': self.post.pk}))
         self.check_context_contains_page_or_post(response.context, post=True)
 
+    def test_post_detail_comments_paginated(self):
+        """- Проверка постраничного вывода комментариев к посту"""
+        Comment.objects.bulk_create(
+            Comment(post=self.post, author=self.user, text=f'Комментарий {i}')
+            for i in range(settings.COMMENTS_PER_PAGE + 1)
+        )
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        post_cache.invalidate_key(self.post.pk)
+        self.guest_client.get(url)
+        caches['pages'].clear()
+        # Пост и автор в кэше объектов, из базы - только комментарии.
+        with self.assertNumQueries(1):
+            response = self.guest_client.get(url)
+        comments = response.context['comments']
+        self.assertEqual(len(comments), settings.COMMENTS_PER_PAGE)
+        self.assertEqual(comments[0].text, 'Комментарий 0')
+        response = self.guest_client.get(url, {'after': comments.next_cursor})
+        self.assertEqual(
+            [comment.text for comment in response.context['comments']],
+            [f'Комментарий {settings.COMMENTS_PER_PAGE}'])
+
     def test_create_post_page_show_correct_context(self):
         """- Проверка контекста страницы create_post"""
         pages = ((reverse('posts:post_create'), False), (reverse(
@@ -160,6 +193,114 @@ class PostsPagesTests(TestCase):
                 self.assertEqual(
                     len(response.context['page_obj']), expected_count)
 
+    def test_paginator_cursor_navigation(self):
+        """- Проверка перехода по страницам через курсоры after/before"""
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост курсора {i}', group=self.group)
+            for i in range(settings.POSTS_PER_PAGE + 3)
+        )
+        url = reverse('posts:index')
+        first_page = self.guest_client.get(url).context['page_obj']
+        self.assertTrue(first_page.has_next())
+        self.assertFalse(first_page.has_previous())
+        second_page = self.guest_client.get(
+            url, {'after': first_page.next_cursor}).context['page_obj']
+        self.assertEqual(second_page.number, 2)
+        self.assertEqual(len(second_page), 4)
+        self.assertFalse(second_page.has_next())
+        self.assertTrue(
+            set(first_page).isdisjoint(set(second_page)))
+        before = second_page.paginator.cursor_for(second_page[0], 2)
+        previous_page = self.guest_client.get(
+            url, {'before': before}).context['page_obj']
+        self.assertEqual(list(previous_page), list(first_page))
+
+    def test_paginator_broken_cursor(self):
+        """- Проверка, что битый курсор отдаёт первую страницу"""
+        response = self.guest_client.get(
+            reverse('posts:index'), {'after': 'not-a-cursor'})
+        self.assertEqual(response.context['page_obj'].number, 1)
+        self.assertIn(self.post, response.context['page_obj'])
+
+    def test_paginator_bad_input(self):
+        """- Проверка, что мусор в курсорах и ?page= даёт первую страницу"""
+        cursors = [
+            encode_cursor(['2020-13-45T10:00:00+00:00', 1], 2),
+            encode_cursor(['2020-01-01T10:00:00+00:00', 2 ** 70], 2),
+            encode_cursor(['2020-01-01T10:00:00+00:00', 1], 2 ** 70),
+        ]
+        params = [{'after': cursor} for cursor in cursors]
+        params += [{'page': '9' * 20}, {'page': 10 ** 6}]
+        for query in params:
+            with self.subTest(query=query):
+                for url in (reverse('posts:index'), reverse('api:index')):
+                    response = self.guest_client.get(url, query)
+                    self.assertEqual(response.status_code, 200)
+                response = self.authorized_client.get(
+                    reverse('posts:index'), query)
+                self.assertEqual(response.context['page_obj'].number, 1)
+        response = self.guest_client.get(reverse('posts:search'), {
+            'q': 'пост', 'after': encode_cursor([1.0, 2 ** 70], 2)})
+        self.assertEqual(response.status_code, 200)
+
+    def test_list_pages_query_count(self):
+        """- Проверка постоянного числа запросов на страницу ленты"""
+        authors = [
+            User.objects.create_user(username=f'author{i}')
+            for i in range(settings.POSTS_PER_PAGE)
+        ]
+        Post.objects.bulk_create(
+            Post(author=author, text='Пост автора', group=self.group)
+            for author in authors
+        )
+        # Группа и автор берутся из кэша объектов после первого запроса.
+        pages = {
+            reverse('posts:index'): 1,
+            reverse('posts:group_list', kwargs={'slug': self.group.slug}): 1,
+            reverse('posts:profile', kwargs={'username': self.user}): 1,
+        }
+        for url, queries in pages.items():
+            with self.subTest(url=url):
+                cache.clear()
+                # Первый запрос заодно оценивает число постов для окна
+                # пагинации, дальше оценка берётся из кэша.
+                self.guest_client.get(url, {'page': 2})
+                with self.assertNumQueries(queries):
+                    self.guest_client.get(url)
+
+    def test_page_window(self):
+        """- Проверка окна номеров страниц по примерному числу постов"""
+        self.assertEqual(
+            page_window(50, 100), [1, None, 48, 49, 50, 51, 52, None, 100])
+        self.assertEqual(page_window(3, 7), [1, 2, 3, 4, 5, 6, 7])
+        Post.objects.bulk_create(
+            Post(author=self.user, text=f'Пост {i}', group=self.group)
+            for i in range(settings.POSTS_PER_PAGE * 6)
+        )
+        cache.clear()
+        response = self.guest_client.get(reverse('posts:index'), {'page': 3})
+        page_obj = response.context['page_obj']
+        self.assertEqual(page_obj.page_window, list(range(1, 8)))
+        # Соседи - по курсору, последняя - обратным запросом, а не OFFSET.
+        self.assertContains(response, f'?after={page_obj.next_cursor}')
+        self.assertContains(response, '?page=5')
+        self.assertContains(response, '?page=last')
+        last = self.guest_client.get(
+            reverse('posts:index'), {'page': 'last'}).context['page_obj']
+        self.assertEqual(last.number, 7)
+        self.assertFalse(last.has_next())
+        self.assertEqual(
+            last[-1], Post.objects.order_by('pub_date', 'pk').first())
+        with self.settings(PAGINATOR_MAX_OFFSET=settings.POSTS_PER_PAGE):
+            caches['pages'].clear()
+            response = self.guest_client.get(
+                reverse('posts:index'), {'page': 2})
+            self.assertEqual(
+                response.context['page_obj'].page_window, [1, 2, 3, None, 7])
+        response = self.guest_client.get(
+            reverse('posts:profile', kwargs={'username': self.user}))
+        self.assertEqual(response.context['page_obj'].page_window, [1, 2])
+
     def test_post_group_index_exists(self):
         """- Проверка наличия поста с указанной группой на Главной странице"""
         response = self.authorized_client.get(
@@ -201,9 +342,117 @@ class PostsPagesTests(TestCase):
             group=self.group
         )
         response_1 = self.authorized_client.get(reverse('posts:index'))
-        Post.objects.get(pk=post.id).delete()
+        # Изменение в обход сигналов не сбрасывает кэш фрагмента
+        Post.objects.filter(pk=post.id).update(text='Изменённый текст')
+        response_2 = self.authorized_client.get(reverse('posts:index'))
+        self.assertEqual(response_1.content, response_2.content)
+
+    def test_index_page_cache_invalidation(self):
+        """- Проверка сброса кэша главной страницы при изменении постов"""
+        response_1 = self.authorized_client.get(reverse('posts:index'))
+        post = Post.objects.create(
+            author=self.user,
+            text='Пост после кэширования',
+            group=self.group
+        )
+        response_2 = self.authorized_client.get(reverse('posts:index'))
+        self.assertNotEqual(response_1.content, response_2.content)
+        self.assertContains(response_2, post.text)
+        post.delete()
         response_3 = self.authorized_client.get(reverse('posts:index'))
-        self.assertEqual(response_1.content, response_3.content)
+        self.assertNotContains(response_3, post.text)
+
+    def test_conditional_get(self):
+        """- Проверка ответа 304 для неизменившейся страницы"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        response = self.authorized_client.get(url)
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertNotEqual(self.guest_client.get(url)['ETag'], etag)
+        # Комментарий к другому посту не меняет валидатор этой страницы.
+        other = User.objects.create_user(username='other')
+        Comment.objects.create(
+            post=Post.objects.create(author=other, text='Другой пост'),
+            author=other, text='Чужой комментарий')
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Новый комментарий')
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_conditional_get_after_follow(self):
+        """- Проверка, что подписка меняет ETag чужого поста"""
+        author = User.objects.create_user(username='AuthorNoName')
+        post = Post.objects.create(author=author, text='Пост автора')
+        url = reverse('posts:post_detail', kwargs={'post_id': post.pk})
+        etag = self.authorized_client.get(url)['ETag']
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': author}))
+        response = self.authorized_client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'отписаться от автора')
+
+    def test_anonymous_page_cache(self):
+        """- Проверка кэша страниц для гостей и его адресного сброса"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'miss')
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'hit')
+        self.assertContains(response, self.post.text)
+        self.assertNotIn('X-Page-Cache', self.authorized_client.get(url))
+        # Чужая область не сбрасывается, своя - сбрасывается
+        Group.objects.create(title='Другая', slug='other-group')
+        self.assertEqual(self.guest_client.get(url)['X-Page-Cache'], 'hit')
+        Comment.objects.create(
+            post=self.post, author=self.user, text='Свежий комментарий')
+        response = self.guest_client.get(url)
+        self.assertEqual(response['X-Page-Cache'], 'miss')
+        self.assertContains(response, 'Свежий комментарий')
+
+    def test_page_scope_versions_expire(self):
+        """- Проверка, что версии областей страниц не копятся вечно"""
+        url = reverse('posts:post_detail', kwargs={'post_id': self.post.pk})
+        self.guest_client.get(url)
+        key = _scope_key(f'post:{self.post.pk}')
+        self.assertIsNotNone(caches['counters'].get(key))
+        later = time.time() + settings.PAGE_SCOPE_TIMEOUT + 1
+        with mock.patch('time.time', return_value=later):
+            self.assertIsNone(caches['counters'].get(key))
+
+    def test_feeds(self):
+        """- Проверка лент RSS и Atom: кэш, 304 и сброс"""
+        urls = (
+            reverse('posts:feed'),
+            reverse('posts:feed_atom'),
+            reverse('posts:group_feed', kwargs={'slug': self.group.slug}),
+            reverse('posts:profile_feed', kwargs={'username': self.user}),
+            reverse(
+                'posts:profile_feed_atom', kwargs={'username': self.user}),
+        )
+        for url in urls:
+            with self.subTest(url=url):
+                response = self.guest_client.get(url)
+                self.assertContains(response, self.post.text)
+                with self.assertNumQueries(0):
+                    response = self.guest_client.get(url)
+                self.assertEqual(response['X-Page-Cache'], 'hit')
+                response = self.guest_client.get(
+                    url, HTTP_IF_NONE_MATCH=response['ETag'])
+                self.assertEqual(response.status_code, 304)
+        self.assertIn(
+            'atom', self.guest_client.get(urls[1])['Content-Type'])
+        post = Post.objects.create(
+            author=self.user, text='Пост для ленты', group=self.group)
+        for url in urls:
+            with self.subTest(url=url):
+                self.assertContains(self.guest_client.get(url), post.text)
+        response = self.guest_client.get(
+            reverse('posts:group_feed', kwargs={'slug': 'missing'}))
+        self.assertEqual(response.status_code, 404)
 
     def test_follow(self):
         """- Проверка добавления подписки"""
@@ -224,6 +473,78 @@ class PostsPagesTests(TestCase):
         with self.assertRaises(Follow.DoesNotExist):
             Follow.objects.get(user=self.user, author=author)
 
+    def test_follow_set_cache(self):
+        """- Проверка кэша подписок пользователя"""
+        author = User.objects.create_user(username='AuthorNoName')
+        reader = User.objects.get(pk=self.user.pk)
+        self.assertFalse(follows.is_following(reader, author.pk))
+        self.authorized_client.get(reverse(
+            'posts:profile_follow', kwargs={'username': author}))
+        # Подписка сбросила массив: он перечитывается из базы один раз.
+        reader = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(1):
+            self.assertTrue(follows.is_following(reader, author.pk))
+        reader = User.objects.get(pk=self.user.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(follows.is_following(reader, author.pk))
+            self.assertFalse(follows.is_following(reader, self.user.pk))
+        post = Post.objects.create(author=author, text='Пост автора')
+        response = self.authorized_client.get(
+            reverse('posts:post_detail', kwargs={'post_id': post.pk}))
+        self.assertContains(response, 'отписаться от автора')
+        self.authorized_client.get(reverse(
+            'posts:profile_unfollow', kwargs={'username': author}))
+        reader = User.objects.get(pk=self.user.pk)
+        self.assertFalse(follows.is_following(reader, author.pk))
+
+    def test_follow_unfollow_idempotent(self):
+        """- Проверка повторной подписки и отписки без подписки"""
+        author = User.objects.create_user(username='AuthorNoName')
+        follow_url = reverse(
+            'posts:profile_follow', kwargs={'username': author})
+        unfollow_url = reverse(
+            'posts:profile_unfollow', kwargs={'username': author})
+        self.authorized_client.get(follow_url)
+        self.authorized_client.get(follow_url)
+        self.assertEqual(
+            Follow.objects.filter(user=self.user, author=author).count(), 1)
+        author.stats.refresh_from_db()
+        self.assertEqual(author.stats.followers_count, 1)
+        self.authorized_client.get(unfollow_url)
+        response = self.authorized_client.get(unfollow_url)
+        self.assertRedirects(response, reverse(
+            'posts:profile', kwargs={'username': author}))
+        author.stats.refresh_from_db()
+        self.assertEqual(author.stats.followers_count, 0)
+
+    def test_bulk_follow(self):
+        """- Проверка пакетной подписки и отписки"""
+        authors = [
+            User.objects.create_user(username=f'author{number}')
+            for number in range(3)
+        ]
+        post = Post.objects.create(text='Пост автора', author=authors[0])
+        Follow.objects.create(user=self.user, author=authors[0])
+        url = reverse('posts:bulk_follow')
+        response = self.authorized_client.post(url, {
+            'usernames': 'author0, author1 author2 HasNoName missing'})
+        self.assertEqual(response.json(), {'action': 'follow', 'changed': 2})
+        self.assertEqual(
+            set(Follow.objects.filter(user=self.user).values_list(
+                'author__username', flat=True)),
+            {'author0', 'author1', 'author2'})
+        self.user.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.following_count, 3)
+        response = self.authorized_client.post(url, {
+            'usernames': ['author0', 'author1'], 'action': 'unfollow'})
+        self.assertEqual(response.json()['changed'], 2)
+        self.user.stats.refresh_from_db()
+        self.assertEqual(self.user.stats.following_count, 1)
+        self.assertFalse(TimelineEntry.objects.filter(
+            user=self.user, post=post).exists())
+        self.assertEqual(
+            self.authorized_client.get(url).status_code, 405)
+
     def test_follow_contain_post_for_follower(self):
         """- Проверка наличия поста избранного автора в ленте follow"""
         author = User.objects.create_user(username='AuthorNoName')
@@ -247,3 +568,138 @@ class PostsPagesTests(TestCase):
             Follow.objects.get(user=self.user, author=author)
         response = self.authorized_client.get(reverse('posts:follow_index'))
         self.assertNotIn(post, response.context['page_obj'])
+
+    def test_timeline_follows_subscriptions(self):
+        """- Проверка наполнения ленты подписок при записи"""
+        author = User.objects.create_user(username='AuthorNoName')
+        old_post = Post.objects.create(text='Старый пост', author=author)
+        Follow.objects.create(user=self.user, author=author)
+        new_post = Post.objects.create(text='Новый пост', author=author)
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(
+                user=self.user).values_list('post', flat=True)),
+            {old_post.pk, new_post.pk})
+        Follow.objects.get(user=self.user, author=author).delete()
+        self.assertFalse(
+            TimelineEntry.objects.filter(user=self.user).exists())
+
+    def test_timeline_fan_out_on_read_for_popular_author(self):
+        """- Проверка чтения постов популярного автора без раскладки"""
+        backend = DatabaseTimelineBackend(fanout_limit=1)
+        author = User.objects.create_user(username='AuthorNoName')
+        Follow.objects.create(user=self.user, author=author)
+        post = Post.objects.create(text='Пост популярного', author=author)
+        TimelineEntry.objects.all().delete()
+        backend.add_post(post)
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(list(backend.feed(self.user)), [post])
+
+    def test_timeline_keeps_posts_after_popularity_drops(self):
+        """- Проверка, что посты популярного автора не пропадают из ленты"""
+        backend = DatabaseTimelineBackend(fanout_limit=2)
+        author = User.objects.create_user(username='AuthorNoName')
+        reader = User.objects.create_user(username='reader')
+        Follow.objects.create(user=self.user, author=author)
+        Follow.objects.create(user=reader, author=author)
+        post = Post.objects.create(text='Пост популярного', author=author)
+        TimelineEntry.objects.filter(post=post).delete()
+        backend.add_post(post)
+        self.assertFalse(TimelineEntry.objects.filter(post=post).exists())
+        Follow.objects.get(user=reader, author=author).delete()
+        self.assertEqual(
+            backend.feed_keys(self.user, 10), [(post.pub_date, post.pk)])
+
+    def test_timeline_pages_merge_pulled_authors(self):
+        """- Проверка страниц ленты из разложенных и читаемых постов"""
+        popular = User.objects.create_user(username='popular')
+        regular = User.objects.create_user(username='regular')
+        Follow.objects.create(user=self.user, author=popular)
+        Follow.objects.create(user=self.user, author=regular)
+        for i in range(4):
+            Post.objects.create(text=f'Популярный {i}', author=popular)
+            Post.objects.create(text=f'Обычный {i}', author=regular)
+        popular.stats.timeline_pulled = True
+        popular.stats.save()
+        # Два поста успели разложиться до пометки, два - нет.
+        TimelineEntry.objects.filter(post__in=list(
+            popular.posts.values_list('pk', flat=True)[:2])).delete()
+        expected = list(Post.objects.filter(
+            author__in=[popular, regular]).order_by('-pub_date', '-pk'))
+        paginator = TimelinePaginator(Post.objects.all(), 3, self.user)
+        page = paginator.get_cursor_page()
+        seen = list(page)
+        while page.has_next():
+            page = paginator.get_cursor_page(after=page.next_cursor)
+            seen += list(page)
+        self.assertEqual(seen, expected)
+        previous = paginator.get_cursor_page(
+            before=paginator.cursor_for(seen[6], 3))
+        self.assertEqual(list(previous), expected[3:6])
+
+    def test_search_finds_posts_with_snippets(self):
+        """- Проверка полнотекстового поиска и сброса индекса"""
+        post = Post.objects.create(
+            author=self.user, text='Редкое слово кукурузохранилище')
+        url = reverse('posts:search')
+        response = self.guest_client.get(url, {'q': 'кукурузохранилище'})
+        self.assertEqual(list(response.context['page_obj']), [post])
+        self.assertContains(response, '<mark>кукурузохранилище</mark>')
+        post.text = 'Другой текст'
+        post.save()
+        response = self.guest_client.get(url, {'q': 'кукурузохранилище'})
+        self.assertEqual(len(response.context['page_obj']), 0)
+
+    def test_pagination_links_drop_unknown_params(self):
+        """- Проверка, что чужие параметры не попадают в ссылки"""
+        for i in range(settings.POSTS_PER_PAGE + 1):
+            Post.objects.create(author=self.user, text=f'Пост {i}')
+        response = self.authorized_client.get(
+            reverse('posts:index'), {'x': 'чужой'})
+        self.assertContains(response, 'after=')
+        self.assertNotContains(response, 'x=')
+
+    def test_author_rename_refreshes_feeds(self):
+        """- Проверка смены имени автора в лентах и кэше страниц"""
+        author = User.objects.create_user(
+            username='renamed', first_name='Старое')
+        Post.objects.create(author=author, text='Пост автора')
+        url = reverse('posts:index')
+        self.assertContains(self.guest_client.get(url), 'Старое')
+        self.assertContains(self.authorized_client.get(url), 'Старое')
+        author.first_name = 'Новое'
+        author.save()
+        for client in (self.guest_client, self.authorized_client):
+            response = client.get(url)
+            self.assertContains(response, 'Новое')
+            self.assertNotContains(response, 'Старое')
+
+    def test_search_pagination_keeps_query(self):
+        """- Проверка курсорной пагинации результатов поиска"""
+        for i in range(settings.POSTS_PER_PAGE + 2):
+            Post.objects.create(author=self.user, text=f'Поисковый пост {i}')
+        url = reverse('posts:search')
+        response = self.guest_client.get(url, {'q': 'поисковый'})
+        first_page = response.context['page_obj']
+        self.assertEqual(len(first_page), settings.POSTS_PER_PAGE)
+        self.assertContains(response, 'q=%D0%BF%D0%BE')
+        second_page = self.guest_client.get(
+            url, {'q': 'поисковый', 'after': first_page.next_cursor}
+        ).context['page_obj']
+        self.assertEqual(len(second_page), 2)
+        self.assertTrue(set(first_page).isdisjoint(second_page))
+
+
+class PageCacheCommitTest(TransactionTestCase):
+    def setUp(self):
+        caches['pages'].clear()
+        self.user = User.objects.create_user(username='HasNoName')
+
+    def test_page_cached_before_commit_is_dropped(self):
+        """- Проверка сброса страниц, закэшированных до коммита"""
+        url = reverse('posts:index')
+        with transaction.atomic():
+            Post.objects.create(author=self.user, text='Пост в транзакции')
+            # Читатель успел закэшировать страницу под новой версией.
+            self.client.get(url)
+            self.assertEqual(self.client.get(url)['X-Page-Cache'], 'hit')
+        self.assertEqual(self.client.get(url)['X-Page-Cache'], 'miss')
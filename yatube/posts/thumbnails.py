@@ -0,0 +1,220 @@
+"""Фоновая подготовка адаптивных вариантов картинок постов.
+
+Каждая картинка режется в пуле процессов на набор ширин
+`POST_IMAGE_WIDTHS` в форматах `POST_IMAGE_FORMATS` с пропорциями
+`POST_THUMBNAIL_SIZE`. Путь к базовому JPEG записывается в
+`Post.thumbnail`, форматы и ширины - в `Post.image_variants`. Шаблоны выводят
+готовые файлы через `srcset` и не декодируют картинки во время запроса.
+"""
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import PurePosixPath
+from threading import Lock
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps, features
+
+from .cache import bump_feed_generation, post_page_scopes, purge_pages
+from .lookups import post_cache
+from .models import Post
+
+logger = logging.getLogger(__name__)
+
+EXTENSIONS = {'jpeg': 'jpg', 'webp': 'webp'}
+SAVE_OPTIONS = {
+    'jpeg': {'quality': 85, 'optimize': True, 'progressive': True},
+    'webp': {'quality': 80, 'method': 4},
+}
+
+_executor = None
+_executor_lock = Lock()
+
+
+def image_formats():
+    """Форматы вариантов, которые поддерживает установленный Pillow.
+
+    JPEG идёт последним: это запасной формат для `<img src>`.
+    """
+    formats = [
+        image_format for image_format in settings.POST_IMAGE_FORMATS
+        if image_format != 'jpeg' and features.check(image_format)
+    ]
+    return formats + ['jpeg']
+
+
+def variant_name(image_name, width, image_format='jpeg'):
+    stem = PurePosixPath(image_name).with_suffix('')
+    return f'thumbs/{stem}_{width}w.{EXTENSIONS[image_format]}'
+
+
+def thumbnail_name(image_name):
+    """Имя базового JPEG-варианта; меняется вместе с картинкой поста."""
+    return variant_name(image_name, settings.POST_THUMBNAIL_SIZE[0])
+
+
+def variants_value(formats, widths):
+    """Значение `Post.image_variants`: `"webp,jpeg;320,640,960"`."""
+    return ';'.join((','.join(formats), ','.join(map(str, widths))))
+
+
+def parse_variants(value):
+    """Разбирает `Post.image_variants` в пару (форматы, ширины)."""
+    formats, _, widths = value.partition(';')
+    if not formats or not widths:
+        return [], []
+    return formats.split(','), [int(width) for width in widths.split(',')]
+
+
+def render_variants(source, targets, size, widths, formats):
+    """Режет варианты картинки по центру в пропорциях `size`.
+
+    Ширины больше исходной пропускаются, кроме базовой `size[0]`:
+    её, как и раньше, увеличиваем. Выполняется в процессе пула, поэтому
+    не трогает Django и базу; `targets` - шаблон пути с полями
+    `width` и `ext`. Возвращает значение для `Post.image_variants`.
+    """
+    base_width, base_height = size
+    done = []
+    with Image.open(source) as image:
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        for width in sorted(widths):
+            if width > image.width and width != base_width:
+                continue
+            height = round(width * base_height / base_width)
+            variant = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            for image_format in formats:
+                target = targets.format(
+                    width=width, ext=EXTENSIONS[image_format])
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                variant.save(target, image_format.upper(),
+                             **SAVE_OPTIONS[image_format])
+            done.append(width)
+    return variants_value(formats, done)
+
+
+def get_executor(workers=None):
+    """Общий пул процессов; с `workers` - отдельный пул для пакетов."""
+    global _executor
+    if workers:
+        return ProcessPoolExecutor(max_workers=workers)
+    with _executor_lock:
+        if _executor is None:
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.THUMBNAIL_WORKERS)
+        return _executor
+
+
+def _job(post):
+    image_name = post.image.name
+    widths = set(settings.POST_IMAGE_WIDTHS)
+    widths.add(settings.POST_THUMBNAIL_SIZE[0])
+    stem = PurePosixPath(image_name).with_suffix('')
+    args = (
+        default_storage.path(image_name),
+        default_storage.path(f'thumbs/{stem}_{{width}}w.{{ext}}'),
+        settings.POST_THUMBNAIL_SIZE,
+        sorted(widths),
+        image_formats(),
+    )
+    return image_name, args
+
+
+def _store(post_id, image_name, variants):
+    updated = Post.objects.filter(pk=post_id, image=image_name).update(
+        thumbnail=thumbnail_name(image_name),
+        image_variants=variants,
+    )
+    if updated:
+        bump_feed_generation()
+        post_cache.invalidate_key(post_id)
+        post = Post.objects.select_related('author').only(
+            'pk', 'group_id', 'author__username').get(pk=post_id)
+        purge_pages(*post_page_scopes(post))
+
+
+def _on_done(post_id, image_name):
+    def callback(future):
+        # Колбэк идёт в служебном потоке пула со своим соединением к базе.
+        close_old_connections()
+        try:
+            _store(post_id, image_name, future.result())
+        except Exception:
+            logger.exception('Не удалось подготовить картинки поста %s',
+                             post_id)
+        finally:
+            close_old_connections()
+    return callback
+
+
+def generate_thumbnail(post):
+    """Ставит нарезку вариантов картинки поста в очередь пула.
+
+    При `THUMBNAIL_WORKERS = 0` режет их сразу в текущем процессе.
+    """
+    image_name, args = _job(post)
+    if not settings.THUMBNAIL_WORKERS:
+        _store(post.pk, image_name, render_variants(*args))
+        return
+    future = get_executor().submit(render_variants, *args)
+    future.add_done_callback(_on_done(post.pk, image_name))
+
+
+def generate_thumbnails(posts, workers=None):
+    """Режет варианты пачки постов параллельно и ждёт их готовности.
+
+    Возвращает список `(post, error)` для постов, которые не удались.
+    """
+    if workers is None:
+        workers = settings.THUMBNAIL_WORKERS
+    executor = get_executor(workers) if workers else None
+    jobs = []
+    failed = []
+    try:
+        for post in posts:
+            try:
+                image_name, args = _job(post)
+            except Exception as error:
+                failed.append((post, error))
+                continue
+            future = (executor.submit(render_variants, *args)
+                      if executor is not None else None)
+            jobs.append((post, image_name, future, args))
+        for post, image_name, future, args in jobs:
+            try:
+                variants = (render_variants(*args) if future is None
+                            else future.result())
+                _store(post.pk, image_name, variants)
+            except Exception as error:
+                failed.append((post, error))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+    return failed
+
+
+def _generate_quietly(post):
+    # Ошибка нарезки не должна ронять уже закоммиченный запрос.
+    try:
+        generate_thumbnail(post)
+    except Exception:
+        logger.exception('Не удалось подготовить картинки поста %s',
+                         post.pk)
+
+
+def schedule_thumbnail(post):
+    """Запускает нарезку после коммита, если варианты устарели.
+
+    Варианты прежней картинки стираются сразу: до конца нарезки пост
+    показывает исходную картинку.
+    """
+    if post.image and post.thumbnail == thumbnail_name(post.image.name):
+        return
+    if post.thumbnail or post.image_variants:
+        Post.objects.filter(pk=post.pk).update(
+            thumbnail='', image_variants='')
+        post.thumbnail = post.image_variants = ''
+    if post.image:
+        transaction.on_commit(lambda: _generate_quietly(post))
@@ -0,0 +1,245 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import Count, Q
+from django.utils.module_loading import import_string
+
+from .models import Follow, Post, TimelineEntry, UserStats
+from .utils import CursorPaginator, keyset_filter
+
+
+class BaseTimelineBackend:
+    """Интерфейс хранилища лент подписок.
+
+    Лента наполняется при записи (fan-out-on-write): новый пост
+    раскладывается по лентам подписчиков автора. Авторы, у которых
+    подписчиков набралось `TIMELINE_FANOUT_LIMIT`, помечаются флагом
+    `UserStats.timeline_pulled` и больше не раскладываются: их посты
+    подмешиваются в ленту при чтении (fan-out-on-read).
+    """
+
+    def __init__(self, fanout_limit=None):
+        self.fanout_limit = fanout_limit or settings.TIMELINE_FANOUT_LIMIT
+
+    def add_post(self, post):
+        raise NotImplementedError
+
+    def follow(self, user_id, author_id):
+        raise NotImplementedError
+
+    def unfollow(self, user_id, author_id):
+        raise NotImplementedError
+
+    def follow_many(self, user_id, author_ids):
+        for author_id in author_ids:
+            self.follow(user_id, author_id)
+
+    def unfollow_many(self, user_id, author_ids):
+        for author_id in author_ids:
+            self.unfollow(user_id, author_id)
+
+    def rebuild(self, user):
+        raise NotImplementedError
+
+    def rebuild_all(self, users):
+        """Пересобирает ленты всех пользователей из `users`."""
+        for user in users.iterator():
+            self.rebuild(user)
+
+    def feed(self, user):
+        """QuerySet постов ленты подписок: для подсчёта, не для страниц."""
+        raise NotImplementedError
+
+    def feed_keys(self, user, limit, key=None, forward=True):
+        """Ключи (pub_date, id) первых `limit` постов ленты за `key`.
+
+        Лента идёт от новых к старым; `forward=False` - обход назад,
+        к более новым постам. Ключи возвращаются в порядке обхода.
+        """
+        raise NotImplementedError
+
+
+class DatabaseTimelineBackend(BaseTimelineBackend):
+    """Лента в таблице `TimelineEntry` с индексом (user, -pub_date, -post)."""
+
+    batch_size = 500
+
+    def _pushed_authors(self, user):
+        """Подписки пользователя, чьи посты раскладываются по лентам."""
+        return Follow.objects.filter(user=user).exclude(
+            author__stats__timeline_pulled=True).values('author')
+
+    def _pulled_authors(self, user):
+        """Подписки на популярных авторов, читаемые напрямую."""
+        return Follow.objects.filter(
+            user=user, author__stats__timeline_pulled=True).values('author')
+
+    def _push(self, entries):
+        TimelineEntry.objects.bulk_create(
+            entries, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def add_post(self, post):
+        followers = list(
+            Follow.objects.filter(author_id=post.author_id)
+            .values_list('user_id', flat=True)[:self.fanout_limit]
+        )
+        if len(followers) >= self.fanout_limit:
+            UserStats.objects.filter(user_id=post.author_id).update(
+                timeline_pulled=True)
+            return
+        # Уже помеченному автору раскладка не мешает: при чтении ключи
+        # из ленты и из его постов сливаются без повторов.
+        self._push(
+            TimelineEntry(user_id=user_id, post=post, pub_date=post.pub_date)
+            for user_id in followers
+        )
+
+    def follow(self, user_id, author_id):
+        posts = Post.objects.filter(author_id=author_id).exclude(
+            author__stats__timeline_pulled=True).values_list('pk', 'pub_date')
+        self._push(
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts.iterator()
+        )
+
+    def unfollow(self, user_id, author_id):
+        TimelineEntry.objects.filter(
+            user_id=user_id, post__author_id=author_id).delete()
+
+    def follow_many(self, user_id, author_ids):
+        posts = Post.objects.filter(author_id__in=author_ids).exclude(
+            author__stats__timeline_pulled=True).values_list('pk', 'pub_date')
+        self._push(
+            TimelineEntry(user_id=user_id, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts.iterator()
+        )
+
+    def unfollow_many(self, user_id, author_ids):
+        TimelineEntry.objects.filter(
+            user_id=user_id, post__author_id__in=author_ids).delete()
+
+    def rebuild(self, user):
+        TimelineEntry.objects.filter(user=user).delete()
+        posts = Post.objects.filter(
+            author__in=self._pushed_authors(user)
+        ).values_list('pk', 'pub_date')
+        self._push(
+            TimelineEntry(user=user, post_id=pk, pub_date=pub_date)
+            for pk, pub_date in posts.iterator()
+        )
+
+    def rebuild_all(self, users):
+        # Один INSERT ... SELECT вместо запроса на каждого пользователя.
+        users = users.values('pk')
+        TimelineEntry.objects.filter(user__in=users).delete()
+        popular = (
+            Follow.objects.values('author')
+            .annotate(followers=Count('pk'))
+            .filter(followers__gte=self.fanout_limit)
+            .values('author')
+        )
+        UserStats.objects.filter(user__in=popular).update(
+            timeline_pulled=True)
+        pushed = Follow.objects.filter(user__in=users).exclude(
+            author__stats__timeline_pulled=True).values('user', 'author')
+        pushed_sql, pushed_params = pushed.query.sql_with_params()
+        entry_table = TimelineEntry._meta.db_table
+        post_table = Post._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'INSERT INTO {entry_table} (user_id, post_id, pub_date) '
+                f'SELECT follow.user_id, post.id, post.pub_date '
+                f'FROM ({pushed_sql}) follow '
+                f'JOIN {post_table} post '
+                f'ON post.author_id = follow.author_id',
+                pushed_params)
+
+    def feed(self, user):
+        pushed = TimelineEntry.objects.filter(user=user).values('post')
+        return Post.objects.filter(
+            Q(pk__in=pushed) | Q(author__in=self._pulled_authors(user))
+        )
+
+    def feed_keys(self, user, limit, key=None, forward=True):
+        lookup, prefix = ('lt', '-') if forward else ('gt', '')
+        entries = TimelineEntry.objects.filter(user=user)
+        if key is not None:
+            entries = entries.filter(
+                keyset_filter(key, lookup, pk_field='post_id'))
+        keys = list(
+            entries.order_by(f'{prefix}pub_date', f'{prefix}post_id')
+            .values_list('pub_date', 'post_id')[:limit]
+        )
+        # Подзапрос вместо отдельной выборки авторов: без подписок
+        # на популярных авторов он пуст и стоит одного поиска по индексу.
+        posts = Post.objects.filter(author__in=self._pulled_authors(user))
+        if key is not None:
+            posts = posts.filter(keyset_filter(key, lookup))
+        if len(keys) == limit:
+            # Посты дальше последней записи страницы на неё не попадут.
+            posts = posts.filter(keyset_filter(
+                keys[-1], 'gt' if forward else 'lt'))
+        keys += posts.order_by(f'{prefix}pub_date', f'{prefix}pk').values_list(
+            'pub_date', 'pk')[:limit]
+        return sorted(set(keys), reverse=forward)[:limit]
+
+
+class TimelinePaginator(CursorPaginator):
+    """Курсорная пагинация ленты подписок по ключам из бэкенда.
+
+    Страница - это запрос ключей к бэкенду и один запрос постов по id
+    из `object_list`, так что подходит и QuerySet из `values()`.
+    """
+
+    def __init__(self, object_list, per_page, user, backend=None, count=None):
+        self.user = user
+        self.backend = backend or get_timeline_backend()
+        super().__init__(object_list, per_page, count=count)
+
+    def _load(self, keys):
+        # Порядок задают ключи, сортировка в базе не нужна.
+        rows = {
+            self.key_for(row)[1]: row
+            for row in self.object_list.filter(
+                pk__in=[pk for _, pk in keys]).order_by()
+        }
+        return [rows[pk] for _, pk in keys if pk in rows]
+
+    def fetch(self, limit, values=None, forward=True):
+        key = None
+        if values is not None:
+            key = self.parse_key(values)
+            if key is None:
+                return None
+        return self._load(
+            self.backend.feed_keys(self.user, limit, key, forward))
+
+    def _offset_page(self, number):
+        # В object_list все посты, а не лента: смещение - по ключам ленты.
+        bottom = (number - 1) * self.per_page
+        if bottom > settings.PAGINATOR_MAX_OFFSET:
+            return self._first_page()
+        keys = self.backend.feed_keys(
+            self.user, bottom + self.per_page + 1)[bottom:]
+        if not keys:
+            return self._first_page()
+        items = self._load(keys)
+        return self._make_page(items[:self.per_page], number,
+                               cursor=f'page-{number}',
+                               has_next=len(keys) > self.per_page)
+
+
+def timeline_paginator(request, posts, count=None):
+    paginator = TimelinePaginator(
+        posts, settings.POSTS_PER_PAGE, request.user, count=count)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page=request.GET.get('page'),
+    )
+
+
+@lru_cache(maxsize=None)
+def get_timeline_backend():
+    return import_string(settings.TIMELINE_BACKEND)()
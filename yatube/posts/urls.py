@@ -1,10 +1,29 @@
 from django.urls import path
-from . import views
+from . import feeds, views
 
 app_name = 'posts'
 
 urlpatterns = [
     path('', views.index, name='index'),
+    # Ленты RSS и Atom
+    path('feed/', feeds.index_rss, name='feed'),
+    path('feed/atom/', feeds.index_atom, name='feed_atom'),
+    path('group/<slug:slug>/feed/', feeds.group_rss, name='group_feed'),
+    path(
+        'group/<slug:slug>/feed/atom/',
+        feeds.group_atom,
+        name='group_feed_atom'
+    ),
+    path(
+        'profile/<str:username>/feed/',
+        feeds.profile_rss,
+        name='profile_feed'
+    ),
+    path(
+        'profile/<str:username>/feed/atom/',
+        feeds.profile_atom,
+        name='profile_feed_atom'
+    ),
     # Список постов по группам
     path('group/<slug:slug>/', views.group_posts, name='group_list'),
     # Подписки
@@ -18,6 +37,9 @@ urlpatterns = [
         views.profile_unfollow,
         name='profile_unfollow'
     ),
+    path('follow/bulk/', views.bulk_follow, name='bulk_follow'),
+    # Поиск по постам
+    path('search/', views.search, name='search'),
     # Профайл пользователя
     path('profile/<str:username>/', views.profile, name='profile'),
     # Добавление комментария к посту
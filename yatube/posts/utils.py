@@ -1,8 +1,284 @@
-from django.core.paginator import Paginator
+import base64
+import binascii
+import json
+import math
+
 from django.conf import settings
+from django.core.paginator import Page, Paginator
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+# Границы знакового 64-битного целого: больше база не примет.
+MAX_INT = 2 ** 63 - 1
+
+
+def is_db_int(value):
+    """Целое, которое можно передать в запрос (bool не считается)."""
+    return (isinstance(value, int) and not isinstance(value, bool)
+            and -MAX_INT - 1 <= value <= MAX_INT)
+
+
+def encode_cursor(values, number):
+    """Упаковывает значения ключа и номер страницы в непрозрачный токен."""
+    raw = json.dumps([number] + list(values), separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    """Распаковывает токен курсора. Для битого токена возвращает None."""
+    if not token:
+        return None
+    try:
+        padding = '=' * (-len(token) % 4)
+        raw = base64.urlsafe_b64decode(token + padding)
+        number, *values = json.loads(raw.decode())
+    except (binascii.Error, ValueError, TypeError, UnicodeDecodeError):
+        return None
+    if not is_db_int(number) or number < 1:
+        return None
+    return number, values
+
+
+def keyset_filter(key, lookup, date_field='pub_date', pk_field='pk'):
+    """Условие «ключ (дата, id) строго за `key`» для `lookup` lt или gt.
+
+    Лишнее с виду `date <= ...` превращает условие в диапазон по индексу,
+    а не в фильтр по всем строкам от начала ленты.
+    """
+    date_value, pk = key
+    return Q(**{f'{date_field}__{lookup}e': date_value}) & (
+        Q(**{f'{date_field}__{lookup}': date_value})
+        | Q(**{date_field: date_value, f'{pk_field}__{lookup}': pk})
+    )
+
+
+def page_window(number, num_pages, on_each_side=2, on_ends=1):
+    """Номера страниц для навигации: края и соседи текущей.
+
+    Пропуски обозначены None: `page_window(50, 100)` - это
+    `[1, None, 48, 49, 50, 51, 52, None, 100]`. Длина не зависит
+    от числа страниц.
+    """
+    window = []
+    for candidate in (
+            range(1, on_ends + 1),
+            range(number - on_each_side, number + on_each_side + 1),
+            range(num_pages - on_ends + 1, num_pages + 1)):
+        for page in candidate:
+            if page < 1 or page > num_pages or window and page <= window[-1]:
+                continue
+            if window and page > window[-1] + 1:
+                # Пропуск в одну страницу короче показать номером.
+                gap = page - window[-1] > 2
+                window.append(None if gap else page - 1)
+            window.append(page)
+    return window
+
+
+class CursorPaginator(Paginator):
+    """Keyset-пагинатор по паре (pub_date, id).
+
+    Каждая страница выбирается одним запросом `WHERE (pub_date, id) < ...
+    LIMIT per_page + 1`, поэтому глубокие страницы стоят столько же,
+    сколько первая, а `COUNT(*)` не выполняется вовсе.
+
+    Возвращает обычную `Page`: общее число страниц пагинатору неизвестно,
+    поэтому `num_pages` выставляется так, чтобы `has_next()` знал только
+    о существовании следующей страницы. Токены соседних страниц лежат
+    в атрибутах `next_cursor` и `previous_cursor` страницы.
+
+    С примерным числом записей `count` у страницы появляется
+    `page_window` - номера соседних страниц, и `page_links` - параметры
+    ссылок на них. Соседи открываются по курсору, последняя страница -
+    обратным запросом (`?page=last`), остальные - смещением `?page=N`,
+    но только не глубже `PAGINATOR_MAX_OFFSET`; прочие номера не
+    показываются.
+    """
+
+    estimated_count = None
+
+    def __init__(self, object_list, per_page, descending=True,
+                 date_field='pub_date', count=None):
+        self.descending = descending
+        self.date_field = date_field
+        self.estimated_count = count
+        prefix = '-' if descending else ''
+        object_list = object_list.order_by(
+            f'{prefix}{date_field}', f'{prefix}pk')
+        super().__init__(object_list, per_page)
+
+    def key_for(self, obj):
+        return getattr(obj, self.date_field).isoformat(), obj.pk
+
+    def cursor_for(self, obj, number):
+        return encode_cursor(self.key_for(obj), number)
+
+    def parse_key(self, values):
+        """Ключ (дата, id) из значений курсора; None для битого."""
+        try:
+            date_value, pk = values
+        except ValueError:
+            return None
+        try:
+            date_value = parse_datetime(str(date_value))
+        except (ValueError, OverflowError):
+            # Формат верный, но даты не существует: 2020-13-45.
+            return None
+        if date_value is None or not is_db_int(pk):
+            return None
+        return date_value, pk
+
+    def _key_filter(self, values, forward):
+        key = self.parse_key(values)
+        if key is None:
+            return None
+        # Вперёд по ленте при убывающем порядке - значит к меньшим ключам.
+        lookup = 'lt' if forward == self.descending else 'gt'
+        return keyset_filter(key, lookup, self.date_field)
+
+    def fetch(self, limit, values=None, forward=True):
+        """Первые `limit` объектов за ключом `values` в направлении обхода.
+
+        Без ключа - от начала ленты. Для битого ключа возвращает None.
+        """
+        queryset = self.object_list
+        if values is not None:
+            key_filter = self._key_filter(values, forward)
+            if key_filter is None:
+                return None
+            queryset = queryset.filter(key_filter)
+        if not forward:
+            queryset = queryset.reverse()
+        return list(queryset[:limit])
+
+    def _make_page(self, items, number, cursor='', has_next=False):
+        self.num_pages = number + 1 if has_next else number
+        page = Page(items, number, self)
+        page.cursor = cursor
+        page.next_cursor = (
+            self.cursor_for(items[-1], number + 1) if has_next else '')
+        # Со второй страницы назад ведёт ссылка на первую, без курсора.
+        page.previous_cursor = (
+            self.cursor_for(items[0], number - 1) if number > 2 else '')
+        page.page_window = []
+        page.page_links = []
+        if self.estimated_count is not None:
+            # Оценка может отстать: последняя страница та, где нет next.
+            last = number
+            if has_next:
+                last = self._estimated_last(number + 1)
+            for link in self._page_links(page, page_window(number, last),
+                                         last):
+                if link is not None or page.page_links[-1:] != [None]:
+                    page.page_window.append(link and link['number'])
+                    page.page_links.append(link)
+        return page
+
+    def _estimated_last(self, minimum):
+        if self.estimated_count is None:
+            return minimum
+        return max(minimum, math.ceil(self.estimated_count / self.per_page))
+
+    def _page_links(self, page, window, last):
+        """Параметры ссылок на номера окна; None - пропуск."""
+        for number in window:
+            link = {'number': number, 'page': '', 'after': '', 'before': ''}
+            if number is None:
+                link = None
+            elif number in (1, page.number):
+                pass
+            elif number == page.number + 1:
+                link['after'] = page.next_cursor
+            elif number == page.number - 1 and page.previous_cursor:
+                link['before'] = page.previous_cursor
+            elif number == last:
+                link['page'] = 'last'
+            elif (number - 1) * self.per_page <= settings.PAGINATOR_MAX_OFFSET:
+                link['page'] = number
+            else:
+                link = None
+            yield link
+
+    def _first_page(self):
+        items = self.fetch(self.per_page + 1)
+        return self._make_page(items[:self.per_page], 1,
+                               has_next=len(items) > self.per_page)
+
+    def _offset_page(self, number):
+        # Совместимость со старыми ссылками вида ?page=N. Глубже
+        # PAGINATOR_MAX_OFFSET записей смещением не ходим: такой запрос
+        # читает все пропущенные строки.
+        bottom = (number - 1) * self.per_page
+        if bottom > settings.PAGINATOR_MAX_OFFSET:
+            return self._first_page()
+        items = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not items:
+            return self._first_page()
+        return self._make_page(items[:self.per_page], number,
+                               cursor=f'page-{number}',
+                               has_next=len(items) > self.per_page)
+
+    def _last_page(self):
+        # Обратный обход с конца ленты: последняя страница стоит столько
+        # же, сколько первая. Граница страниц может не совпасть со
+        # смещениями, зато назад по курсору ведёт ровно предыдущая часть.
+        items = self.fetch(self.per_page + 1, forward=False)
+        if len(items) <= self.per_page:
+            return self._first_page()
+        items = items[:self.per_page]
+        items.reverse()
+        return self._make_page(items, self._estimated_last(2), cursor='last')
+
+    def get_cursor_page(self, after=None, before=None, page=None):
+        for token, forward in ((after, True), (before, False)):
+            decoded = decode_cursor(token)
+            if decoded is None:
+                continue
+            number, values = decoded
+            if not forward and number < 2:
+                continue
+            items = self.fetch(self.per_page + 1, values, forward)
+            if items is None:
+                continue
+            more = len(items) > self.per_page
+            items = items[:self.per_page]
+            if forward and items:
+                return self._make_page(items, number, token, has_next=more)
+            if not forward and more:
+                items.reverse()
+                return self._make_page(items, number, token, has_next=True)
+            # Дошли назад до начала ленты или курсор указывает в пустоту.
+            return self._first_page()
+        return self._numbered_page(page)
+
+    def _numbered_page(self, page):
+        if page == 'last':
+            return self._last_page()
+        try:
+            number = int(page)
+        except (TypeError, ValueError):
+            number = 1
+        if number > 1:
+            return self._offset_page(number)
+        return self._first_page()
+
+
+def post_paginator(request, post_list, count=None):
+    paginator = CursorPaginator(
+        post_list, settings.POSTS_PER_PAGE, count=count)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page=request.GET.get('page'),
+    )
 
 
-def post_paginator(request, post_list):
-    paginator = Paginator(post_list, settings.POSTS_PER_PAGE)
-    page_number = request.GET.get('page')
-    return paginator.get_page(page_number)
+def comment_paginator(request, comment_list, count=None):
+    paginator = CursorPaginator(
+        comment_list, settings.COMMENTS_PER_PAGE, descending=False,
+        count=count)
+    return paginator.get_cursor_page(
+        after=request.GET.get('after'),
+        before=request.GET.get('before'),
+        page=request.GET.get('page'),
+    )
@@ -1,63 +1,110 @@
+import re
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
+from django.http import JsonResponse
 from django.shortcuts import render, get_object_or_404, redirect
-from .models import Post, User, Group, Follow
+from django.views.decorators.http import require_POST
+from core.db import replica_reads
+from core.metrics import query_budget
+from core.sqlite import retry_on_lock
+from . import follows
+from .models import Post, User
 from .forms import PostForm, CommentForm
-from .utils import post_paginator
-
-
+from .cache import (anonymous_page_cache, conditional_page,
+                    feed_cache_context)
+from .counters import estimated_count, get_user_stats
+from .lookups import author_cache, group_cache, post_cache
+from .search import search_paginator
+from .timeline import get_timeline_backend, timeline_paginator
+from .utils import comment_paginator, post_paginator
+
+
+@query_budget(4)
+@replica_reads
+@conditional_page
+@anonymous_page_cache(lambda: 'index')
 def index(request):
     template = 'posts/index.html'
     title = 'Последние обновления на сайте'
-    post_list = Post.objects.all()
-    page_obj = post_paginator(request, post_list)
+    post_list = Post.objects.for_feed()
+    page_obj = post_paginator(
+        request, post_list, estimated_count('index', Post.objects.all()))
     context = {
         'title': title,
         'page_obj': page_obj,
+        **feed_cache_context(),
     }
     return render(request, template, context)
 
 
+@query_budget(4)
+@replica_reads
+@conditional_page
+@anonymous_page_cache(lambda slug: f'group:{slug}')
 def group_posts(request, slug):
     template = 'posts/group_list.html'
-    group = get_object_or_404(Group, slug=slug)
-    post_list = group.posts.all()
-    page_obj = post_paginator(request, post_list)
+    group = group_cache.get_or_404(slug)
+    post_list = group.posts.for_feed()
+    page_obj = post_paginator(request, post_list, estimated_count(
+        f'group:{group.pk}', group.posts.all()))
     context = {
         'group': group,
         'page_obj': page_obj,
+        **feed_cache_context(),
+    }
+    return render(request, template, context)
+
+
+@query_budget(4)
+def search(request):
+    template = 'posts/search.html'
+    query = request.GET.get('q', '').strip()
+    page_obj = search_paginator(request, query) if query else None
+    context = {
+        'query': query,
+        'page_obj': page_obj,
     }
     return render(request, template, context)
 
 
+@query_budget(5)
+@replica_reads
+@conditional_page
+@anonymous_page_cache(lambda username: f'profile:{username}')
 def profile(request, username):
     # Здесь код запроса к модели и создание словаря контекста
     template = 'posts/profile.html'
-    author = get_object_or_404(User, username=username)
-    post_list_profile = author.posts.all()
-    page_obj = post_paginator(request, post_list_profile)
-    posts_count = post_list_profile.count
-    profile_fullname = get_object_or_404(User, username=username)
-    following = False
-    if request.user.is_authenticated:
-        try:
-            Follow.objects.get(user=request.user, author=author)
-            following = True
-        except Follow.DoesNotExist:
-            following = False
+    author = author_cache.get_or_404(username)
+    post_list_profile = author.posts.for_feed()
+    stats = get_user_stats(author)
+    page_obj = post_paginator(
+        request, post_list_profile, stats.posts_count)
+    following = follows.is_following(request.user, author.pk)
     context = {
-        'username': profile_fullname,
+        'username': author,
         'page_obj': page_obj,
-        'posts_count': posts_count,
+        'posts_count': stats.posts_count,
+        'stats': stats,
         'following': following,
+        **feed_cache_context(),
     }
     return render(request, template, context)
 
 
+@query_budget(5)
+@replica_reads
+@conditional_page
+@anonymous_page_cache(lambda post_id: f'post:{post_id}')
 def post_detail(request, post_id):
     template = 'posts/post_detail.html'
-    post = get_object_or_404(Post, pk=post_id)
-    posts_count = post.author.posts.all().count
-    comments = post.comments.all()
+    post = post_cache.get_or_404(post_id)
+    author = author_cache.get(post.author.username) or post.author
+    posts_count = get_user_stats(author).posts_count
+    comments = comment_paginator(
+        request, post.comments.select_related('author').only(
+            'id', 'text', 'pub_date', 'post_id', 'author__username'),
+        post.comments_count)
     context = {
         'post': post,
         'posts_count': posts_count,
@@ -68,6 +115,7 @@ def post_detail(request, post_id):
 
 
 @login_required
+@retry_on_lock
 def post_create(request):
     template = 'posts/create_post.html'
     form = PostForm(
@@ -88,6 +136,7 @@ def post_create(request):
 
 
 @login_required
+@retry_on_lock
 def post_edit(request, post_id):
     template = 'posts/create_post.html'
     post = get_object_or_404(Post, pk=post_id)
@@ -115,8 +164,9 @@ def post_edit(request, post_id):
 
 
 @login_required
+@retry_on_lock
 def add_comment(request, post_id):
-    post = get_object_or_404(Post, pk=post_id)
+    post = post_cache.get_or_404(post_id)
     form = CommentForm(request.POST or None)
     if form.is_valid():
         comment = form.save(commit=False)
@@ -127,40 +177,64 @@ def add_comment(request, post_id):
 
 
 @login_required
+@query_budget(5)
+@replica_reads
+@conditional_page
 def follow_index(request):
     # информация о текущем пользователе доступна в переменной request.user
     template = 'posts/follow.html'
     title = 'Последние обновления избранных авторов'
-    follow_posts_list = Post.objects.filter(
-        author__following__user=request.user)
-    page_obj = post_paginator(request, follow_posts_list)
+    feed = get_timeline_backend().feed(request.user)
+    page_obj = timeline_paginator(
+        request, Post.objects.for_feed(),
+        estimated_count(f'follow:{request.user.pk}', feed))
     context = {
         'title': title,
         'page_obj': page_obj,
+        **feed_cache_context(),
     }
     return render(request, template, context)
 
 
 @login_required
+@retry_on_lock
 def profile_follow(request, username):
     # Подписаться на автора
-    follow_author = get_object_or_404(User, username=username)
-    if follow_author != request.user and (
-        not request.user.follower.filter(author=follow_author).exists()
-    ):
-        Follow.objects.create(
-            user=request.user,
-            author=follow_author
-        )
+    follow_author = author_cache.get_or_404(username)
+    follows.follow(request.user, follow_author)
     return redirect('posts:profile', username)
 
 
 @login_required
+@retry_on_lock
 def profile_unfollow(request, username):
     # Дизлайк, отписка
-    follow_author = get_object_or_404(User, username=username)
-    Follow.objects.get(
-        user=request.user,
-        author=User.objects.get(username=follow_author),
-    ).delete()
+    follows.unfollow(request.user, username)
     return redirect('posts:profile', username)
+
+
+@login_required
+@require_POST
+@retry_on_lock
+def bulk_follow(request):
+    # Подписка или отписка сразу от многих авторов:
+    # usernames - список или строка имён через пробелы и запятые
+    usernames = {
+        username
+        for value in request.POST.getlist('usernames')
+        for username in re.split(r'[\s,]+', value) if username
+    }
+    action = request.POST.get('action', 'follow')
+    if action not in ('follow', 'unfollow'):
+        return JsonResponse(
+            {'error': 'action: follow или unfollow'}, status=400)
+    if len(usernames) > settings.FOLLOW_BULK_LIMIT:
+        return JsonResponse(
+            {'error': f'не больше {settings.FOLLOW_BULK_LIMIT} авторов'},
+            status=400)
+    authors = User.objects.filter(username__in=usernames)
+    if action == 'follow':
+        changed = follows.bulk_follow(request.user, authors)
+    else:
+        changed = follows.bulk_unfollow(request.user, authors)
+    return JsonResponse({'action': action, 'changed': changed})
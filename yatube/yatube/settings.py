@@ -15,10 +15,46 @@ import os
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Кэш настраивается переменными окружения. По умолчанию у каждого
+# процесса своя память; для нескольких воркеров gunicorn на одной машине
+# подходит общий кэш в файле SQLite:
+#   YATUBE_CACHE_BACKEND=core.cache.SQLiteCache
+#   YATUBE_CACHE_DIR=/var/cache/yatube
+# Таймауты отдельных алиасов: YATUBE_CACHE_<ALIAS>_TIMEOUT (в секундах).
+CACHE_BACKEND = os.getenv('YATUBE_CACHE_BACKEND', 'core.cache.LocMemCache')
+CACHE_DIR = os.getenv('YATUBE_CACHE_DIR', os.path.join(BASE_DIR, 'cache'))
+
+
+def cache_alias(alias, timeout, max_entries=10000):
+    location = alias
+    timeout = os.getenv(f'YATUBE_CACHE_{alias.upper()}_TIMEOUT', timeout)
+    if CACHE_BACKEND == 'core.cache.SQLiteCache':
+        location = os.path.join(CACHE_DIR, f'{alias}.sqlite3')
+    elif CACHE_BACKEND == 'core.cache.FileBasedCache':
+        location = os.path.join(CACHE_DIR, alias)
+    return {
+        'BACKEND': CACHE_BACKEND,
+        'LOCATION': location,
+        'KEY_PREFIX': alias,
+        'TIMEOUT': None if timeout is None else int(timeout),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv(
+                f'YATUBE_CACHE_{alias.upper()}_MAX_ENTRIES', max_entries)),
+        },
     }
+
+
+CACHES = {
+    'default': cache_alias('default', 300),
+    # Фрагменты шаблонов лент
+    'fragments': cache_alias('fragments', 60 * 60 * 6),
+    'sessions': cache_alias('sessions', 60 * 60 * 24 * 14),
+    # Общий уровень кэша групп, авторов и постов (core.objectcache)
+    'objects': cache_alias('objects', 60 * 5),
+    # Целые страницы для анонимных посетителей, сжатые zlib
+    'pages': cache_alias('pages', 60 * 10),
+    # Поколения содержимого и прочие счётчики: не вытесняются по времени
+    'counters': cache_alias('counters', None),
 }
 
 # Quick-start development settings - unsuitable for production
@@ -43,6 +79,7 @@ INSTALLED_APPS = [
     'posts.apps.PostsConfig',
     'users.apps.UsersConfig',
     'core.apps.CoreConfig',
+    'api.apps.ApiConfig',
     'django.contrib.admin',
     'django.contrib.auth',
     'django.contrib.contenttypes',
@@ -56,6 +93,8 @@ MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 MIDDLEWARE = [
+    'core.middleware.RequestMetricsMiddleware',
+    'core.middleware.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -67,11 +106,17 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'yatube.urls'
 
+# Запуск manage.py test с тестовыми настройками
+TEST_RUNNER = 'core.testing.TestRunner'
+
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+SESSION_CACHE_ALIAS = 'sessions'
+
 TEMPLATES_DIR = os.path.join(BASE_DIR, 'templates')
 
 TEMPLATES = [
     {
-        'BACKEND': 'django.template.backends.django.DjangoTemplates',
+        'BACKEND': 'core.templates.DjangoTemplates',
         'DIRS': [TEMPLATES_DIR],
         'APP_DIRS': True,
         'OPTIONS': {
@@ -92,12 +137,58 @@ WSGI_APPLICATION = 'yatube.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
+# Реплики для чтения - копии основной базы, которые обновляет команда
+# sync_replicas (каждые YATUBE_DB_REPLICA_SYNC_INTERVAL секунд):
+#   YATUBE_DB_REPLICAS=/var/lib/yatube/replica1.sqlite3,...
+# Постоянные соединения: YATUBE_DB_CONN_MAX_AGE (секунды) для всех
+# алиасов или YATUBE_DB_<ALIAS>_CONN_MAX_AGE для одного.
+def database(alias, name):
+    return {
         'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+        'NAME': name,
+        'CONN_MAX_AGE': int(os.getenv(
+            f'YATUBE_DB_{alias.upper()}_CONN_MAX_AGE',
+            os.getenv('YATUBE_DB_CONN_MAX_AGE', 0))),
     }
+
+
+DATABASES = {
+    'default': database('default', os.path.join(BASE_DIR, 'db.sqlite3')),
+}
+DATABASE_REPLICA_FILES = {
+    f'replica{number}': path
+    for number, path in enumerate(
+        filter(None, os.getenv('YATUBE_DB_REPLICAS', '').split(',')), 1)
 }
+for alias, path in DATABASE_REPLICA_FILES.items():
+    DATABASES[alias] = {
+        # Реплика открывается только на чтение
+        **database(alias, f'file:{path}?mode=ro'),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_REPLICAS = list(DATABASE_REPLICA_FILES)
+# Прагмы каждого соединения SQLite: WAL - читатели не ждут писателя,
+# busy_timeout - писатели ждут друг друга, а не падают сразу.
+# YATUBE_SQLITE_PRODUCTION=0 оставляет настройки SQLite по умолчанию.
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    # Отрицательное значение - в килобайтах: 64 МБ
+    'cache_size': -64 * 1024,
+    'temp_store': 'MEMORY',
+} if os.getenv('YATUBE_SQLITE_PRODUCTION', '1') == '1' else {}
+# Повторы вьюх с @retry_on_lock при "database is locked"
+SQLITE_LOCK_RETRIES = 5
+SQLITE_LOCK_RETRY_DELAY = 0.05
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+# Как часто sync_replicas копирует основную базу в реплики
+REPLICA_SYNC_INTERVAL = int(os.getenv('YATUBE_DB_REPLICA_SYNC_INTERVAL', 30))
+# Сколько секунд после записи клиент читает из основной базы. Это же -
+# предельное отставание: более старые реплики не используются.
+REPLICA_PIN_SECONDS = 2 * REPLICA_SYNC_INTERVAL
+REPLICA_PIN_COOKIE = 'primary_reads'
 
 
 # Password validation
@@ -153,3 +244,62 @@ EMAIL_FILE_PATH = os.path.join(BASE_DIR, 'sent_emails')
 
 # Количество постов на странице в пагинаторе
 POSTS_PER_PAGE = 10
+# Количество комментариев на странице поста
+COMMENTS_PER_PAGE = 20
+# Глубже скольких записей старые ссылки ?page=N ведут на первую страницу
+PAGINATOR_MAX_OFFSET = 1000
+# Сколько живёт примерное число записей для окна пагинации
+COUNT_CACHE_TIMEOUT = 60 * 10
+# Записей на странице JSON API
+API_PAGE_SIZE = 20
+# Записей в лентах RSS и Atom и длина заголовка записи
+FEED_ITEMS = 20
+FEED_TITLE_LENGTH = 60
+# Время жизни фрагментов лент в кэше; при изменении постов, комментариев
+# и подписок фрагменты инвалидируются сменой поколения
+FEED_CACHE_TIMEOUT = 60 * 60 * 6
+# Кэш объектов: записей в LRU процесса, их время жизни и как часто
+# процесс сверяет версию, чтобы увидеть сброс из других процессов
+OBJECT_CACHE_SIZE = 1000
+OBJECT_CACHE_TTL = 60
+OBJECT_CACHE_CHECK_INTERVAL = 1
+# Сколько помнить, что объекта нет; создание объекта сбрасывает раньше
+OBJECT_CACHE_NEGATIVE_TTL = 30
+# Сколько живёт в кэше массив подписок пользователя
+FOLLOW_SET_TIMEOUT = 60 * 60 * 24
+# Уровень сжатия zlib страниц в кэше 'pages'
+PAGE_CACHE_LEVEL = 6
+# Время жизни версий областей страниц в кэше 'counters'; не короче
+# жизни страниц, иначе версии областей копились бы без конца
+PAGE_SCOPE_TIMEOUT = 60 * 60 * 24
+# Входит в ETag страниц: смена версии при выкладке шаблонов сбрасывает
+# закэшированные у клиентов страницы
+ETAG_VERSION = os.getenv('YATUBE_RELEASE', '1')
+
+# Полнотекстовый поиск: FTS5 на SQLite, LIKE на остальных базах
+SEARCH_BACKEND = (
+    'posts.search.SQLiteSearchBackend'
+    if DATABASES['default']['ENGINE'] == 'django.db.backends.sqlite3'
+    else 'posts.search.SimpleSearchBackend'
+)
+
+# Варианты картинок постов (ширины x форматы) режутся в пуле процессов;
+# 0 - резать синхронно после сохранения поста
+POST_THUMBNAIL_SIZE = (960, 339)
+POST_IMAGE_WIDTHS = (320, 640, 960, 1920)
+POST_IMAGE_FORMATS = ('webp', 'jpeg')
+THUMBNAIL_WORKERS = int(os.getenv('YATUBE_THUMBNAIL_WORKERS', 2))
+
+# Хранилище лент подписок (fan-out-on-write)
+TIMELINE_BACKEND = 'posts.timeline.DatabaseTimelineBackend'
+# Посты авторов с таким числом подписчиков и больше в ленты не
+# раскладываются, а подмешиваются при чтении
+TIMELINE_FANOUT_LIMIT = 1000
+# Сколько авторов можно (от)подписать одним запросом
+FOLLOW_BULK_LIMIT = 500
+
+# Метрики запросов: сколько последних запросов каждой вьюхи держать
+# для /stats/requests/; превышение бюджета запросов - ошибка, а не
+# предупреждение в лог (включается в тестах)
+REQUEST_STATS_WINDOW = 500
+QUERY_BUDGET_RAISE = os.getenv('YATUBE_QUERY_BUDGET_RAISE', '0') == '1'
@@ -18,11 +18,15 @@ from django.urls import path, include
 from django.conf import settings
 from django.conf.urls.static import static
 
+from core.views import request_stats
+
 handler403 = 'core.views.permission_denied'
 handler404 = 'core.views.page_not_found'
 handler500 = 'core.views.server_error'
 urlpatterns = [path('', include('posts.urls', namespace='posts')),
+               path('api/v1/', include('api.urls', namespace='api')),
                path('admin/', admin.site.urls),
+               path('stats/requests/', request_stats, name='request_stats'),
                path('about/', include('about.urls', namespace='about')),
                path('auth/', include('users.urls'))]
 if settings.DEBUG: